@@ -0,0 +1,117 @@
+"""
+Micro-batching scheduler for the event loop.
+
+Concurrent `submit` calls that share a group key are held for a short window (or
+until `max_items` are waiting) and dispatched together through `run_batch`. Any
+item the batch could not answer is retried on its own through `run_single`, and
+each caller gets its own result or exception back. The batch can return
+`Retry(hint)` for an item to pass `hint` along to that retry.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, List, Set, Tuple, TypeVar
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class Retry:
+    """Stands in for a batch result: retry the item alone, with `hint` passed to `run_single`."""
+
+    __slots__ = ("hint",)
+
+    def __init__(self, hint: Any):
+        self.hint = hint
+
+
+BatchRunner = Callable[[Hashable, List[T]], Awaitable[List[Any]]]
+SingleRunner = Callable[[Hashable, T, Any], Awaitable[R]]
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    `run_batch` receives every item of one group and returns a result per item in
+    the same order, with None (or a Retry) for items it could not handle. If it
+    raises, the whole batch falls back to `run_single`, which gets the Retry's
+    hint or None.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        run_batch: BatchRunner,
+        run_single: SingleRunner,
+        window_seconds: float,
+        max_items: int,
+    ):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.max_items = max_items
+        self._run_batch = run_batch
+        self._run_single = run_single
+        self._pending: Dict[Hashable, List[Tuple[T, asyncio.Future]]] = {}
+        self._timers: Dict[Hashable, asyncio.TimerHandle] = {}
+        self._dispatches: Set[asyncio.Task] = set()
+
+    async def submit(self, group: Hashable, item: T) -> R:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(group, [])
+        pending.append((item, future))
+        if len(pending) >= self.max_items:
+            self._flush(group)
+        elif len(pending) == 1:
+            self._timers[group] = loop.call_later(self.window_seconds, self._flush, group)
+        return await future
+
+    def _flush(self, group: Hashable):
+        timer = self._timers.pop(group, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(group, None)
+        if not batch:
+            return
+        task = asyncio.ensure_future(self._dispatch(group, batch))
+        self._dispatches.add(task)
+        task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, group: Hashable, batch: List[Tuple[T, asyncio.Future]]):
+        items = [item for item, _ in batch]
+        results: List[Any] = [None] * len(batch)
+        if len(batch) > 1:
+            metrics.increment(f"{self.name}.batch.requests")
+            metrics.increment(f"{self.name}.batch.items", len(batch))
+            try:
+                answered = await self._run_batch(group, items)
+                if len(answered) == len(batch):
+                    results = list(answered)
+                else:
+                    logger.warning("%s batch returned %s results for %s items", self.name, len(answered), len(batch))
+            except Exception as exc:
+                logger.warning("%s batch of %s failed, retrying items one by one: %s", self.name, len(batch), exc)
+
+        retry = [index for index, result in enumerate(results) if result is None or isinstance(result, Retry)]
+        if len(batch) > 1 and retry:
+            metrics.increment(f"{self.name}.batch.fallback_items", len(retry))
+        singles = await asyncio.gather(
+            *(self._run_single(group, items[index], _hint(results[index])) for index in retry),
+            return_exceptions=True,
+        )
+        for index, outcome in zip(retry, singles):
+            results[index] = outcome
+
+        for (_, future), outcome in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(outcome, BaseException):
+                future.set_exception(outcome)
+            else:
+                future.set_result(outcome)
+
+
+def _hint(result: Any) -> Any:
+    return result.hint if isinstance(result, Retry) else None
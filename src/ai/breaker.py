@@ -0,0 +1,197 @@
+"""
+Circuit breaker and hedged requests for calls to OpenAI.
+
+The breaker counts consecutive upstream failures (connection errors, timeouts,
+rate limits, 5xx). Once OPENAI_BREAKER_FAILURE_THRESHOLD is reached it opens and
+every call fails fast with CircuitOpenError, so callers can go straight to their
+offline fallback. After OPENAI_BREAKER_RECOVERY_SECONDS it lets a few probe calls
+through (half-open) and closes again on the first success.
+
+`hedged` fires a second attempt when the first has not answered within the
+observed p95 latency and returns whichever finishes first.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional, TypeVar
+
+from openai import APIConnectionError, InternalServerError, RateLimitError
+
+import metrics
+from settings import env_float, env_int
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+UPSTREAM_ERRORS = (APIConnectionError, RateLimitError, InternalServerError, asyncio.TimeoutError, TimeoutError)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling OpenAI while the breaker is open."""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int, recovery_seconds: float, half_open_calls: int):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.half_open_calls = half_open_calls
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def before_call(self):
+        """Admits a call or raises CircuitOpenError."""
+        with self._lock:
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self.recovery_seconds:
+                    metrics.increment(f"{self.name}.breaker.rejected")
+                    raise CircuitOpenError(f"{self.name} circuit is open")
+                self._transition(HALF_OPEN)
+                self._probes = 0
+            if self._state == HALF_OPEN:
+                if self._probes >= self.half_open_calls:
+                    metrics.increment(f"{self.name}.breaker.rejected")
+                    raise CircuitOpenError(f"{self.name} circuit is half-open")
+                self._probes += 1
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            if self._state != CLOSED:
+                self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self._transition(OPEN)
+
+    def record_outcome(self, exc: Optional[BaseException]):
+        if exc is None:
+            self.record_success()
+        elif isinstance(exc, UPSTREAM_ERRORS):
+            self.record_failure()
+        else:
+            # A request the API answered, even with a client error, says the upstream is up.
+            self.record_success()
+
+    def call(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        self.before_call()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as exc:
+            self.record_outcome(exc)
+            raise
+        self.record_success()
+        return result
+
+    async def call_async(self, fn: Callable[[], Awaitable[T]]) -> T:
+        self.before_call()
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            self._release_probe()
+            raise
+        except BaseException as exc:
+            self.record_outcome(exc)
+            raise
+        self.record_success()
+        return result
+
+    def _release_probe(self):
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes:
+                self._probes -= 1
+
+    def _transition(self, state: str):
+        logger.warning("Circuit %s: %s -> %s", self.name, self._state, state)
+        metrics.increment(f"{self.name}.breaker.{state}")
+        self._state = state
+
+
+class LatencyWindow:
+    """Rolling window of recent call durations, in seconds."""
+
+    def __init__(self, size: int):
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, fraction: float, min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < max(1, min_samples):
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def hedged(name: str, attempt: Callable[[], Awaitable[T]], delay: Optional[float]) -> T:
+    """
+    Runs `attempt`, and if it has not finished after `delay` seconds runs it again
+    concurrently. The first success wins and the other attempt is cancelled.
+    With `delay` None this is a plain await.
+    """
+    first = asyncio.ensure_future(attempt())
+    if delay is None:
+        return await first
+
+    attempts = {first}
+    try:
+        done, _ = await asyncio.wait(attempts, timeout=delay)
+        if not done:
+            metrics.increment(f"{name}.hedge.fired")
+            attempts.add(asyncio.ensure_future(attempt()))
+
+        error: Optional[BaseException] = None
+        pending = attempts
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not first:
+                        metrics.increment(f"{name}.hedge.won")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in attempts:
+            if not task.done():
+                task.cancel()
+
+
+_breaker: Optional[CircuitBreaker] = None
+_breaker_lock = threading.Lock()
+
+
+def get_breaker() -> CircuitBreaker:
+    """The breaker shared by every OpenAI call: they all depend on the same upstream."""
+    global _breaker
+    if _breaker is None:
+        with _breaker_lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker(
+                    "openai",
+                    failure_threshold=env_int("OPENAI_BREAKER_FAILURE_THRESHOLD", 5, minimum=1),
+                    recovery_seconds=env_float("OPENAI_BREAKER_RECOVERY_SECONDS", 30.0, minimum=0.0),
+                    half_open_calls=env_int("OPENAI_BREAKER_HALF_OPEN_CALLS", 1, minimum=1),
+                )
+    return _breaker
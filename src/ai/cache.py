@@ -0,0 +1,149 @@
+import functools
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import async_db
+import metrics
+from db import get_cached_classification, prune_classification_cache, put_cached_classification
+from db_writer import get_db_writer
+from settings import env_bool, env_float, env_int
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    return _WHITESPACE_RE.sub(" ", (text or "").strip()).casefold()
+
+
+def cache_key(text: str, date_context: str) -> str:
+    """Content address for a classification: normalized text plus the prompt's date."""
+    material = f"{date_context}\n{normalize_text(text)}"
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ClassificationCache:
+    """
+    Two-tier cache for classifier results: an in-memory LRU with TTL in front of
+    the `classification_cache` SQLite table, so repeats survive restarts.
+    Values are stored as JSON, so every hit returns a fresh dict.
+
+    Code on the event loop uses `get_async`, which reads the table on the
+    `db_reader` pool. `put` never waits for the disk: the row is queued on the
+    group-commit writer and a failed write is only logged.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, persistent: bool = True):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persistent = persistent
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Blocking lookup for callers off the event loop."""
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is not None or not self.persistent:
+            return self._finish_lookup(key, value, None)
+        try:
+            stored = get_cached_classification(key, now - self.ttl_seconds)
+        except Exception as exc:
+            logger.warning("Classification cache read failed: %s", exc)
+            stored = None
+        return self._finish_lookup(key, None, stored)
+
+    async def get_async(self, key: str) -> Optional[Dict[str, Any]]:
+        """Like `get`, with the disk tier read on the `db_reader` pool."""
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is not None or not self.persistent:
+            return self._finish_lookup(key, value, None)
+        try:
+            stored = await async_db.get_cached_classification(key, now - self.ttl_seconds)
+        except Exception as exc:
+            logger.warning("Classification cache read failed: %s", exc)
+            stored = None
+        return self._finish_lookup(key, None, stored)
+
+    def put(self, key: str, value: Dict[str, Any]):
+        now = time.time()
+        payload = json.dumps(value, ensure_ascii=False)
+        self._remember(key, now, payload)
+        if self.persistent:
+            try:
+                future = get_db_writer().submit(functools.partial(put_cached_classification, key, payload, now))
+            except Exception as exc:
+                logger.warning("Classification cache write failed: %s", exc)
+                return
+            future.add_done_callback(_log_write_failure)
+
+    def _get_memory(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        metrics.increment("classifier.cache.lookup")
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[0] <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                metrics.increment("classifier.cache.memory_hit")
+                return json.loads(entry[1])
+            if entry:
+                del self._entries[key]
+        return None
+
+    def _finish_lookup(
+        self,
+        key: str,
+        value: Optional[Dict[str, Any]],
+        stored: Optional[Tuple[float, str]],
+    ) -> Optional[Dict[str, Any]]:
+        if value is not None:
+            return value
+        if stored is not None:
+            created_at, payload = stored
+            self._remember(key, created_at, payload)
+            metrics.increment("classifier.cache.disk_hit")
+            return json.loads(payload)
+        metrics.increment("classifier.cache.miss")
+        return None
+
+    def prune(self) -> int:
+        """Drops persisted entries older than the TTL; run once at startup."""
+        if not self.persistent:
+            return 0
+        return prune_classification_cache(time.time() - self.ttl_seconds)
+
+    def _remember(self, key: str, created_at: float, payload: str):
+        with self._lock:
+            self._entries[key] = (created_at, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def _log_write_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning("Classification cache write failed: %s", future.exception())
+
+
+_cache: Optional[ClassificationCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> ClassificationCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ClassificationCache(
+                    max_entries=env_int("CLASSIFIER_CACHE_SIZE", 1024, minimum=1),
+                    ttl_seconds=env_float("CLASSIFIER_CACHE_TTL_SECONDS", 86400.0, minimum=0.0),
+                    persistent=env_bool("CLASSIFIER_CACHE_PERSISTENT", True),
+                )
+    return _cache
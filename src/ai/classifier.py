@@ -1,40 +1,89 @@
+import asyncio
 import json
 import logging
-import os
-from datetime import datetime
-from typing import Any, Dict, Optional
-
-from openai import OpenAI
+import time
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+import metrics
+from ai import offline
+from ai.batching import MicroBatcher, Retry
+from ai.breaker import LatencyWindow, get_breaker, hedged
+from ai.cache import cache_key, get_cache
+from ai.client import get_async_client, get_client
+from ai.dates import budapest_today, resolve_deadline
+from ai.router import ModelRouter
+from ai.rules import build_payload, pre_classify
+from ai.schemas import (
+    CLASSIFICATION_BATCH_SCHEMA,
+    CLASSIFICATION_SCHEMA,
+    SCORED_CLASSIFICATION_BATCH_SCHEMA,
+    SCORED_CLASSIFICATION_SCHEMA,
+    SchemaError,
+    parse_json,
+    response_format,
+    validate_classification,
+    validate_classification_batch,
+    validate_scored_classification,
+    validate_scored_classification_batch,
+)
+from ai.singleflight import SingleFlight
+from settings import env_bool, env_float, env_int, env_str
 
 logger = logging.getLogger(__name__)
 
-SCHEMA_EXAMPLE = json.dumps(
+_SCHEMA_SHAPE = {
+    "type": "task | idea | note",
+    "task": {
+        "title": "",
+        "details": "",
+        "deadline": "YYYY-MM-DD or null",
+        "tags": [],
+        "estimated_minutes": None,
+    },
+    "idea": {
+        "title": "",
+        "details": "",
+        "tags": [],
+    },
+    "note": {
+        "title": "",
+        "content": "",
+        "tags": [],
+    },
+    "confidence": 0.9,
+}
+
+SCHEMA_EXAMPLE = json.dumps(_SCHEMA_SHAPE, indent=2)
+
+# Combined mode: the task section also carries the scores `analyze_task` would
+# produce, so a task costs one round trip instead of two.
+SCORED_SCHEMA_EXAMPLE = json.dumps(
     {
-        "type": "task | idea | note",
+        **_SCHEMA_SHAPE,
         "task": {
-            "title": "",
-            "details": "",
-            "deadline": "YYYY-MM-DD or null",
-            "tags": [],
-            "estimated_minutes": None,
-        },
-        "idea": {
-            "title": "",
-            "details": "",
-            "tags": [],
-        },
-        "note": {
-            "title": "",
-            "content": "",
-            "tags": [],
+            **_SCHEMA_SHAPE["task"],
+            "importance": 1,
+            "urgency": 1,
+            "reason": "explain briefly the scores",
         },
     },
     indent=2,
 )
 
-def _get_system_prompt() -> str:
+SCORING_RULES = """
+- For tasks, also score importance (impact if completed) and urgency (time sensitivity or deadline pressure) as integers from 1 to 5, with a one-sentence reason.""".rstrip()
+
+
+BATCH_RULES = """
+- BATCH MODE: the user message is a JSON array of {"id", "text"} messages. Classify each one independently and reply with {"items": [...]}, one object per message, each following the schema above plus the message's "id".""".strip()
+
+
+def _get_system_prompt(today: Optional[str] = None, include_scores: bool = False) -> str:
     """Generate system prompt with current date context."""
-    today = datetime.now().strftime("%Y-%m-%d")
+    today = today or _today().isoformat()
+    schema = SCORED_SCHEMA_EXAMPLE if include_scores else SCHEMA_EXAMPLE
+    scoring = SCORING_RULES if include_scores else ""
     return f"""You are an expert productivity assistant. Classify a single Telegram message as a task, idea, or note.
 
 Today is {today}. Use this date when interpreting relative dates like "tomorrow", "Sunday", "next week".
@@ -46,43 +95,315 @@ Rules:
 - The classic message "I buy present by Sunday" must ALWAYS be classified as a TASK.
 - Output STRICT JSON only (no markdown, prose, or code fences).
 - The JSON MUST follow this exact schema and field names:
-{SCHEMA_EXAMPLE}
+{schema}
 - Fill only the object that matches `type`. The other two objects must be null.
 - Use ISO format for deadlines (YYYY-MM-DD) or null when unknown.
-- Always provide a concise title for tasks/ideas; default tags to [] when you have no tags.""".strip()
+- Always provide a concise title for tasks/ideas; default tags to [] when you have no tags.
+- Set `confidence` to how sure you are of the whole answer, from 0 to 1.{scoring}""".strip()
 
 
 def classify_message(text: str) -> Dict[str, Any]:
     """
     Sends the message to OpenAI for classification and returns the structured JSON.
-    Falls back to wrapping the text as a note only when JSON parsing fails.
+    Obvious messages are answered by the rule-based pre-classifier without a call.
+    Relative deadlines ("tomorrow", "by Sunday") are resolved locally and override the
+    model's date, which lets identical messages share a cache entry across days.
+    With CLASSIFIER_INCLUDE_SCORES (the default) tasks come back already scored.
+    Replies are schema-constrained; one that still fails validation is classified
+    offline (or wrapped as a note) and counted under `classifier.parse_failures`.
+    CLASSIFIER_BACKEND=offline answers from the local model instead of OpenAI.
+    Raises CircuitOpenError without calling out while the OpenAI breaker is open.
+    """
+    clean_text = (text or "").strip()
+    if _offline_backend():
+        return classify_offline(clean_text) or _note_fallback(clean_text)
+
+    today = _today()
+    deadline = resolve_deadline(clean_text, today)
+    ruled = pre_classify(clean_text)
+    if ruled is not None:
+        return _with_deadline(_normalize_payload(ruled), deadline)
+
+    include_scores = env_bool("CLASSIFIER_INCLUDE_SCORES", True)
+    key = cache_key(clean_text, _cache_context(today, deadline, include_scores))
+    cached = get_cache().get(key)
+    if cached is not None:
+        return _with_deadline(cached, deadline)
+
+    result = _inflight.do(key, _classify_blocking, clean_text, key, today.isoformat(), include_scores)
+    return _with_deadline(result, deadline)
+
+
+async def classify_message_async(text: str) -> Dict[str, Any]:
+    """
+    Async counterpart of `classify_message` for use inside the event loop.
+    At most CLASSIFIER_MAX_CONCURRENCY requests are in flight at once and each
+    one is bounded by CLASSIFIER_TIMEOUT_SECONDS. Cache misses that arrive within
+    CLASSIFIER_BATCH_WINDOW_MS of each other share one multi-item request. With
+    CLASSIFIER_HEDGE_ENABLED a second attempt starts after the observed p95 latency.
+    """
+    clean_text = (text or "").strip()
+    if _offline_backend():
+        return classify_offline(clean_text) or _note_fallback(clean_text)
+
+    today = _today()
+    deadline = resolve_deadline(clean_text, today)
+    ruled = pre_classify(clean_text)
+    if ruled is not None:
+        return _with_deadline(_normalize_payload(ruled), deadline)
+
+    include_scores = env_bool("CLASSIFIER_INCLUDE_SCORES", True)
+    key = cache_key(clean_text, _cache_context(today, deadline, include_scores))
+    cached = await get_cache().get_async(key)
+    if cached is not None:
+        return _with_deadline(cached, deadline)
+
+    group = (today.isoformat(), include_scores)
+    batcher = _get_batcher()
+    if batcher is None:
+        result = await _inflight.do_async(key, lambda: _classify_one(group, (clean_text, key)))
+    else:
+        result = await _inflight.do_async(key, lambda: batcher.submit(group, (clean_text, key)))
+    return _with_deadline(result, deadline)
+
+
+def classify_offline(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Classifies without OpenAI: the rule-based pre-classifier first, then the local
+    naive Bayes model. Returns None when the model abstains (too little training
+    data or too low a posterior), so callers fall back to saving a note.
     """
     clean_text = (text or "").strip()
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise RuntimeError("OPENAI_API_KEY is not set.")
+    today = _today()
+    payload = pre_classify(clean_text)
+    if payload is None:
+        guess = offline.predict(clean_text)
+        if guess is None:
+            return None
+        label, confidence = guess
+        logger.debug("Offline classifier picked %s (p=%.2f)", label, confidence)
+        metrics.increment(f"offline.predict.{label}")
+        payload = build_payload(label, clean_text, clean_text)
+    return _with_deadline(_normalize_payload(payload), resolve_deadline(clean_text, today))
+
+
+def _offline_backend() -> bool:
+    return env_str("CLASSIFIER_BACKEND", "openai").lower() == "offline"
+
+
+# Keyed on the cache key, so identical messages sent concurrently (a double tap,
+# the same forward in two chats) share one upstream call across both entry points.
+_inflight = SingleFlight("classifier")
 
-    client = OpenAI(api_key=api_key)
+BatchItem = Tuple[str, str]
+
+
+_router = ModelRouter("classifier", "CLASSIFIER_MODELS", "gpt-4.1-nano,gpt-4.1-mini", "CLASSIFIER_MIN_CONFIDENCE", 0.7)
+
+
+def _classify_blocking(clean_text: str, key: str, today: str, include_scores: bool) -> Dict[str, Any]:
+    def attempt(model: str) -> Dict[str, Any]:
+        request = _build_request(clean_text, today, include_scores, model)
+        return _parse(get_breaker().call(get_client().responses.create, **request), include_scores)
+
+    try:
+        parsed = _router.run(attempt)
+    except SchemaError as exc:
+        return _invalid_reply(clean_text, exc)
+    return _complete(parsed, clean_text, key)
+
+
+async def _classify_one(group: Tuple[str, bool], item: BatchItem, start: Optional[int] = None) -> Dict[str, Any]:
+    """Classifies one message through the router, from tier `start` (default: the cheapest)."""
+    today, include_scores = group
+    clean_text, key = item
+
+    async def attempt(model: str) -> Dict[str, Any]:
+        request = _build_request(clean_text, today, include_scores, model)
+        return _parse(await _create_response(request), include_scores)
+
+    try:
+        parsed = await _router.run_async(attempt, start=start or 0)
+    except SchemaError as exc:
+        return _invalid_reply(clean_text, exc)
+    return _complete(parsed, clean_text, key)
 
-    response = client.responses.create(
-        model="gpt-4.1-mini",
-        input=[
-            {"role": "system", "content": _get_system_prompt()},
+
+async def _classify_batch(group: Tuple[str, bool], items: List[BatchItem]) -> List[Any]:
+    today, include_scores = group
+    # Batches go to the cheapest tier. Items it is unsure about come back as
+    # Retry(1) and are retried one by one from the next tier up; unanswered items
+    # come back as None and are retried from the cheapest tier.
+    model = _router.models()[0]
+    response = await _create_response(_build_batch_request([text for text, _ in items], today, include_scores, model))
+    results = _parse_batch(response, len(items), include_scores)
+    for (clean_text, key), result in zip(items, results):
+        if isinstance(result, dict):
+            get_cache().put(key, result)
+            offline.observe(clean_text, result["type"])
+    return results
+
+
+async def _create_response(request: Dict[str, Any]) -> Any:
+    timeout = env_float("CLASSIFIER_TIMEOUT_SECONDS", 20.0, minimum=1.0)
+    breaker = get_breaker()
+
+    async def attempt() -> Any:
+        started = time.monotonic()
+        response = await breaker.call_async(
+            lambda: asyncio.wait_for(
+                get_async_client().responses.create(**request, timeout=timeout),
+                timeout=timeout,
+            )
+        )
+        latency.record(time.monotonic() - started)
+        return response
+
+    latency = _latency_for(request["model"])
+    async with _get_semaphore():
+        return await hedged("classifier", attempt, _hedge_delay(latency))
+
+
+_latencies: Dict[str, LatencyWindow] = {}
+
+
+def _latency_for(model: str) -> LatencyWindow:
+    window = _latencies.get(model)
+    if window is None:
+        window = _latencies.setdefault(model, LatencyWindow(env_int("CLASSIFIER_LATENCY_WINDOW", 200, minimum=10)))
+    return window
+
+
+def _hedge_delay(latency: LatencyWindow) -> Optional[float]:
+    # Hedging starts once enough samples exist for a meaningful p95.
+    if not env_bool("CLASSIFIER_HEDGE_ENABLED", False):
+        return None
+    p95 = latency.percentile(0.95, min_samples=env_int("CLASSIFIER_HEDGE_MIN_SAMPLES", 20, minimum=1))
+    if p95 is None:
+        return None
+    return max(p95, env_float("CLASSIFIER_HEDGE_MIN_DELAY_MS", 200.0, minimum=0.0) / 1000)
+
+
+_batcher: Optional[MicroBatcher] = None
+
+
+def _get_batcher() -> Optional[MicroBatcher]:
+    global _batcher
+    window_ms = env_int("CLASSIFIER_BATCH_WINDOW_MS", 25, minimum=0)
+    if not window_ms:
+        return None
+    if _batcher is None:
+        _batcher = MicroBatcher(
+            "classifier",
+            _classify_batch,
+            _classify_one,
+            window_seconds=window_ms / 1000,
+            max_items=env_int("CLASSIFIER_BATCH_MAX_ITEMS", 16, minimum=1),
+        )
+    return _batcher
+
+
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(env_int("CLASSIFIER_MAX_CONCURRENCY", 8, minimum=1))
+    return _semaphore
+
+
+def _today() -> date:
+    return budapest_today()
+
+
+def _cache_context(today: date, deadline: Optional[str], include_scores: bool) -> str:
+    # The answer only depends on the calendar day when the model had to resolve
+    # the deadline itself, or when it scored urgency against that day.
+    if include_scores:
+        return f"{today.isoformat()}|scored"
+    return "local-deadline" if deadline else today.isoformat()
+
+
+def _with_deadline(result: Dict[str, Any], deadline: Optional[str]) -> Dict[str, Any]:
+    if deadline and result.get("task") is not None:
+        result["task"]["deadline"] = deadline
+    return result
+
+
+def _build_request(clean_text: str, today: str, include_scores: bool, model: str) -> Dict[str, Any]:
+    return {
+        "model": model,
+        "input": [
+            {"role": "system", "content": _get_system_prompt(today, include_scores)},
             {"role": "user", "content": clean_text},
         ],
-    )
+        "text": response_format(
+            "classification",
+            SCORED_CLASSIFICATION_SCHEMA if include_scores else CLASSIFICATION_SCHEMA,
+        ),
+    }
+
+
+def _build_batch_request(texts: List[str], today: str, include_scores: bool, model: str) -> Dict[str, Any]:
+    messages = [{"id": index, "text": text} for index, text in enumerate(texts)]
+    return {
+        "model": model,
+        "input": [
+            {"role": "system", "content": f"{_get_system_prompt(today, include_scores)}\n{BATCH_RULES}"},
+            {"role": "user", "content": json.dumps(messages, ensure_ascii=False)},
+        ],
+        "text": response_format(
+            "classification_batch",
+            SCORED_CLASSIFICATION_BATCH_SCHEMA if include_scores else CLASSIFICATION_BATCH_SCHEMA,
+        ),
+    }
 
+
+def _parse_batch(response: Any, count: int, include_scores: bool) -> List[Any]:
+    """
+    Maps a batched answer back to input order. Raises when the reply does not match
+    the batch schema. Items the reply skips (unknown or repeated ids) come back as
+    None; items with low confidence while a stronger model is configured come back
+    as Retry(1), so their retry starts at the second tier.
+    """
+    payload_text = _extract_text(response)
+    if not payload_text:
+        raise ValueError("OpenAI returned an empty batch payload.")
+    validator = validate_scored_classification_batch if include_scores else validate_classification_batch
+    parsed = parse_json(payload_text, validator, "classifier")
+
+    results: List[Any] = [None] * count
+    for item in parsed["items"]:
+        index = item["id"]
+        if not 0 <= index < count or results[index] is not None:
+            continue
+        if not _router.is_confident(item) and _router.can_escalate():
+            metrics.increment("classifier.batch.low_confidence")
+            results[index] = Retry(1)
+            continue
+        results[index] = _normalize_payload(item)
+    return results
+
+
+def _parse(response: Any, include_scores: bool) -> Dict[str, Any]:
     payload_text = _extract_text(response)
     if not payload_text:
         raise ValueError("OpenAI returned an empty payload.")
+    validator = validate_scored_classification if include_scores else validate_classification
+    return parse_json(payload_text, validator, "classifier")
 
-    try:
-        parsed = json.loads(payload_text)
-    except json.JSONDecodeError:
-        logger.warning("OpenAI returned invalid JSON; wrapping as note.")
-        return _note_fallback(clean_text)
 
-    return _normalize_payload(parsed)
+def _invalid_reply(clean_text: str, exc: SchemaError) -> Dict[str, Any]:
+    logger.warning("OpenAI reply failed schema validation, classifying offline: %s", exc)
+    return classify_offline(clean_text) or _note_fallback(clean_text)
+
+
+def _complete(parsed: Dict[str, Any], clean_text: str, key: str) -> Dict[str, Any]:
+    result = _normalize_payload(parsed)
+    get_cache().put(key, result)
+    offline.observe(clean_text, result["type"])
+    return result
 
 
 def _extract_text(response: Any) -> Optional[str]:
@@ -156,9 +477,20 @@ def _normalize_task(section: Optional[Dict[str, Any]]) -> Dict[str, Any]:
         "deadline": section.get("deadline"),
         "tags": section.get("tags") or [],
         "estimated_minutes": section.get("estimated_minutes"),
+        "importance": _optional_score(section.get("importance")),
+        "urgency": _optional_score(section.get("urgency")),
+        "reason": section.get("reason") or None,
     }
 
 
+def _optional_score(value: Any) -> Optional[int]:
+    try:
+        score = int(value)
+    except (TypeError, ValueError):
+        return None
+    return max(1, min(score, 5))
+
+
 def _normalize_idea(section: Optional[Dict[str, Any]]) -> Dict[str, Any]:
     section = section or {}
     return {
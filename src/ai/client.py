@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import os
+import threading
+from typing import Optional, Set
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+from settings import env_float, env_int
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_client: Optional[OpenAI] = None
+_async_client: Optional[AsyncOpenAI] = None
+_transport: Optional[httpx.BaseTransport] = None
+_async_transport: Optional[httpx.AsyncBaseTransport] = None
+_closing: Set[asyncio.Task] = set()
+
+
+def get_client() -> OpenAI:
+    """
+    Returns the process-wide OpenAI client. Its HTTP pool keeps connections
+    alive between calls so requests skip the TCP/TLS handshake.
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = OpenAI(
+                    api_key=_require_api_key(),
+                    timeout=_timeout(),
+                    max_retries=_max_retries(),
+                    http_client=DefaultHttpxClient(limits=_limits(), transport=_transport),
+                )
+    return _client
+
+
+def get_async_client() -> AsyncOpenAI:
+    global _async_client
+    if _async_client is None:
+        with _lock:
+            if _async_client is None:
+                _async_client = AsyncOpenAI(
+                    api_key=_require_api_key(),
+                    timeout=_timeout(),
+                    max_retries=_max_retries(),
+                    http_client=DefaultAsyncHttpxClient(limits=_limits(), transport=_async_transport),
+                )
+    return _async_client
+
+
+def configure_transport(
+    transport: Optional[httpx.BaseTransport] = None,
+    async_transport: Optional[httpx.AsyncBaseTransport] = None,
+):
+    """
+    Routes all OpenAI traffic through the given httpx transports, e.g. an
+    `httpx.MockTransport` serving canned responses for local runs. Passing
+    nothing restores the real network transport. Existing clients are dropped
+    so the next call picks up the new transport.
+    """
+    global _client, _async_client, _transport, _async_transport
+    with _lock:
+        stale_client, stale_async_client = _client, _async_client
+        _client = None
+        _async_client = None
+        _transport = transport
+        _async_transport = async_transport
+    if stale_client is not None:
+        stale_client.close()
+    if stale_async_client is not None:
+        _close_async_client(stale_async_client)
+
+
+def _close_async_client(client: AsyncOpenAI):
+    # Called from sync code; inside a running loop the close is scheduled on it.
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        try:
+            asyncio.run(client.close())
+        except Exception as exc:
+            logger.warning("Failed to close replaced async OpenAI client: %s", exc)
+        return
+    task = loop.create_task(client.close())
+    _closing.add(task)
+    task.add_done_callback(_closing.discard)
+
+
+async def close_clients():
+    global _client, _async_client
+    with _lock:
+        client, async_client = _client, _async_client
+        _client = None
+        _async_client = None
+    if client is not None:
+        client.close()
+    if async_client is not None:
+        await async_client.close()
+    logger.info("OpenAI clients closed")
+
+
+def _require_api_key() -> str:
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        if _transport is not None or _async_transport is not None:
+            return "stub"
+        raise RuntimeError("OPENAI_API_KEY is not set.")
+    return api_key
+
+
+def _limits() -> httpx.Limits:
+    pool_size = env_int("OPENAI_POOL_SIZE", 20, minimum=1)
+    return httpx.Limits(
+        max_connections=pool_size,
+        max_keepalive_connections=pool_size,
+        keepalive_expiry=env_float("OPENAI_KEEPALIVE_SECONDS", 60.0, minimum=1.0),
+    )
+
+
+def _timeout() -> float:
+    return env_float("OPENAI_TIMEOUT_SECONDS", 30.0, minimum=1.0)
+
+
+def _max_retries() -> int:
+    # The SDK's own retries would multiply with the ones the breaker, the router
+    # and the analysis queue already make, so they are off unless asked for.
+    return env_int("OPENAI_MAX_RETRIES", 0, minimum=0)
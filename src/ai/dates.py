@@ -0,0 +1,117 @@
+"""
+Deterministic extraction of task deadlines from English relative-date phrases.
+
+Resolves "today", "tomorrow", weekdays ("by Sunday", "next friday"), weekdays of
+next week ("Friday next week", "next week on Tuesday"), offsets ("in 3 days",
+"in two weeks", "next week") and ISO dates against the Budapest calendar day, so
+the answer never depends on the model doing date arithmetic. A message with two
+phrases that resolve to different days is left to the model.
+"""
+import re
+from datetime import date, datetime, timedelta
+from typing import Callable, List, Match, Optional, Pattern, Tuple
+
+from db import BUDAPEST_TZ
+
+# Short forms that double as common words ("sat", "sun", "wed") are left out.
+_WEEKDAYS = {
+    "monday": 0,
+    "tue": 1, "tues": 1, "tuesday": 1,
+    "wednesday": 2,
+    "thu": 3, "thur": 3, "thurs": 3, "thursday": 3,
+    "fri": 4, "friday": 4,
+    "saturday": 5,
+    "sunday": 6,
+}
+
+_NUMBERS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+}
+
+_WEEKDAY_NAMES = "|".join(sorted(_WEEKDAYS, key=len, reverse=True))
+_NUMBER_WORDS = "|".join(sorted(_NUMBERS, key=len, reverse=True))
+
+
+def _iso(match: Match[str], today: date) -> Optional[date]:
+    try:
+        return date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+    except ValueError:
+        return None
+
+
+def _weekday(match: Match[str], today: date) -> date:
+    target = _WEEKDAYS[match.group(2).lower()]
+    days_ahead = (target - today.weekday()) % 7
+    if match.group(1) and match.group(1).lower() == "next" and days_ahead == 0:
+        days_ahead = 7
+    return today + timedelta(days=days_ahead)
+
+
+def _weekday_next_week(match: Match[str], today: date) -> date:
+    target = _WEEKDAYS[(match.group(1) or match.group(2)).lower()]
+    next_monday = today + timedelta(days=7 - today.weekday())
+    return next_monday + timedelta(days=target)
+
+
+def _offset(match: Match[str], today: date) -> date:
+    amount = match.group(1).lower()
+    count = int(amount) if amount.isdigit() else _NUMBERS[amount]
+    unit_days = 7 if match.group(2).lower().startswith("week") else 1
+    return today + timedelta(days=count * unit_days)
+
+
+def _fixed(days: int) -> Callable[[Match[str], date], date]:
+    return lambda match, today: today + timedelta(days=days)
+
+
+_RULES: List[Tuple[Pattern[str], Callable[[Match[str], date], Optional[date]]]] = [
+    (re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b"), _iso),
+    (
+        re.compile(
+            rf"\b(?:(?:on|by|until|till)\s+)?({_WEEKDAY_NAMES})\s+(?:of\s+)?next week\b"
+            rf"|\bnext week\s+(?:on\s+|by\s+)?({_WEEKDAY_NAMES})\b",
+            re.IGNORECASE,
+        ),
+        _weekday_next_week,
+    ),
+    (re.compile(r"\bday after tomorrow\b", re.IGNORECASE), _fixed(2)),
+    (re.compile(r"\b(?:tomorrow|tmrw|tmr)\b", re.IGNORECASE), _fixed(1)),
+    (re.compile(r"\b(?:today|tonight|this (?:morning|afternoon|evening))\b", re.IGNORECASE), _fixed(0)),
+    (re.compile(r"\bnext week\b", re.IGNORECASE), _fixed(7)),
+    (re.compile(rf"\bin (\d{{1,3}}|{_NUMBER_WORDS}) (days?|weeks?)\b", re.IGNORECASE), _offset),
+    (re.compile(rf"\b(?:(this|next|on|by|until|till)\s+)?({_WEEKDAY_NAMES})\b", re.IGNORECASE), _weekday),
+]
+
+
+def budapest_today() -> date:
+    return datetime.now(BUDAPEST_TZ).date()
+
+
+def resolve_deadline(text: str, today: Optional[date] = None) -> Optional[str]:
+    """
+    Returns the ISO date the message's date phrases resolve to, or None when it has
+    no phrase this parser understands or several that disagree ("by Friday, or
+    Monday at the latest"), which are left for the model to interpret.
+    """
+    if not text:
+        return None
+    today = today or budapest_today()
+
+    found: List[Tuple[int, int, date]] = []
+    for pattern, resolve in _RULES:
+        for match in pattern.finditer(text):
+            resolved = resolve(match, today)
+            if resolved is not None:
+                found.append((match.start(), match.end(), resolved))
+
+    # A phrase inside a longer one ("Friday" in "Friday next week") is part of it.
+    dates = {
+        resolved
+        for start, end, resolved in found
+        if not any(
+            other_start <= start and end <= other_end and (other_start, other_end) != (start, end)
+            for other_start, other_end, _ in found
+        )
+    }
+    return dates.pop().isoformat() if len(dates) == 1 else None
@@ -0,0 +1,142 @@
+"""
+Local multinomial naive Bayes classifier over hashed word n-grams.
+
+It is trained from the stored tasks/ideas/notes on first use and then learns from
+every message the LLM classifies, so it can stand in when OpenAI is down,
+rate-limited or deliberately switched off (CLASSIFIER_BACKEND=offline).
+
+`predict` abstains (returns None) unless at least two labels have
+OFFLINE_CLASSIFIER_MIN_DOCS training messages each and the winner's posterior is
+at least OFFLINE_CLASSIFIER_MIN_CONFIDENCE, so a barely trained model does not
+pin every message on one label.
+"""
+import logging
+import math
+import re
+import threading
+import zlib
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+import metrics
+from db import get_training_samples
+from settings import env_float, env_int
+
+logger = logging.getLogger(__name__)
+
+LABELS = ("task", "idea", "note")
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+metrics.define_rate("offline.agreement_rate", "offline.agreement.match", "offline.agreement.checked")
+
+
+class NaiveBayesClassifier:
+    """
+    Feature counts are kept per label in sparse dicts keyed by the crc32 hash of
+    each unigram and bigram, bucketed into `buckets` slots. Training is O(tokens)
+    and can happen one message at a time.
+    """
+
+    def __init__(self, buckets: int):
+        self.buckets = buckets
+        self._feature_counts: Dict[str, Dict[int, int]] = {label: defaultdict(int) for label in LABELS}
+        self._feature_totals: Dict[str, int] = {label: 0 for label in LABELS}
+        self._doc_counts: Dict[str, int] = {label: 0 for label in LABELS}
+        self._vocabulary: Set[int] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def trained(self) -> bool:
+        return sum(self._doc_counts.values()) > 0
+
+    def learn(self, text: str, label: str):
+        if label not in LABELS:
+            return
+        features = self._features(text)
+        if not features:
+            return
+        with self._lock:
+            counts = self._feature_counts[label]
+            for feature in features:
+                counts[feature] += 1
+            self._feature_totals[label] += len(features)
+            self._doc_counts[label] += 1
+            self._vocabulary.update(features)
+
+    def predict(self, text: str, min_docs: int = 1) -> Optional[Tuple[str, float]]:
+        """
+        Returns (label, posterior probability) over the labels with at least
+        `min_docs` training messages, or None while fewer than two labels qualify.
+        """
+        features = self._features(text)
+        with self._lock:
+            candidates = [label for label in LABELS if self._doc_counts[label] >= max(1, min_docs)]
+            if len(candidates) < 2:
+                return None
+            total_docs = sum(self._doc_counts.values())
+            vocabulary = len(self._vocabulary) or 1
+            scores = {}
+            for label in candidates:
+                # Laplace smoothing on both the prior and the per-feature likelihoods.
+                score = math.log((self._doc_counts[label] + 1) / (total_docs + len(LABELS)))
+                counts = self._feature_counts[label]
+                denominator = math.log(self._feature_totals[label] + vocabulary)
+                for feature in features:
+                    score += math.log(counts.get(feature, 0) + 1) - denominator
+                scores[label] = score
+
+        best = max(scores, key=scores.get)
+        peak = scores[best]
+        normalizer = sum(math.exp(score - peak) for score in scores.values())
+        return best, 1.0 / normalizer
+
+    def _features(self, text: str) -> List[int]:
+        tokens = _TOKEN_RE.findall((text or "").casefold())
+        grams = tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+        return [zlib.crc32(gram.encode("utf-8")) % self.buckets for gram in grams]
+
+
+_model: Optional[NaiveBayesClassifier] = None
+_model_lock = threading.Lock()
+
+
+def get_offline_model() -> NaiveBayesClassifier:
+    """Lazily builds the model and trains it from the stored rows."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                model = NaiveBayesClassifier(env_int("OFFLINE_CLASSIFIER_BUCKETS", 1 << 18, minimum=1024))
+                try:
+                    samples = get_training_samples(env_int("OFFLINE_CLASSIFIER_TRAINING_ROWS", 5000, minimum=0))
+                except Exception as exc:
+                    logger.warning("Could not load offline classifier training rows: %s", exc)
+                    samples = []
+                for label, text in samples:
+                    model.learn(text, label)
+                logger.info("Offline classifier trained on %s stored rows", len(samples))
+                _model = model
+    return _model
+
+
+def predict(text: str) -> Optional[Tuple[str, float]]:
+    """The model's guess, or None when it is too untrained or too unsure to act on."""
+    guess = get_offline_model().predict(text, env_int("OFFLINE_CLASSIFIER_MIN_DOCS", 5, minimum=1))
+    if guess is None or guess[1] < env_float("OFFLINE_CLASSIFIER_MIN_CONFIDENCE", 0.6, minimum=0.0):
+        metrics.increment("offline.abstained")
+        return None
+    return guess
+
+
+def observe(text: str, label: str):
+    """
+    Records whether the offline model agrees with an LLM label, then learns from it.
+    """
+    model = get_offline_model()
+    guess = model.predict(text)
+    if guess is not None:
+        metrics.increment("offline.agreement.checked")
+        if guess[0] == label:
+            metrics.increment("offline.agreement.match")
+    model.learn(text, label)
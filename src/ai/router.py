@@ -0,0 +1,99 @@
+"""
+Cheap-first model routing.
+
+A router holds an ordered list of models, cheapest first, read from an env var
+such as CLASSIFIER_MODELS="gpt-4.1-nano,gpt-4.1-mini". Each call starts at the
+first model and only moves to the next one when the reply fails schema validation
+or its self-reported `confidence` is below the router's threshold. The last model's
+answer is accepted as is. Callers that already know the cheap tiers are unsure
+(an item escalated out of a batch) can pass `start` to skip them. Every attempt is logged with its model, outcome and
+latency, and counted under `<name>.router.<model>.*`.
+"""
+import logging
+import time
+from typing import Any, Awaitable, Callable, List, TypeVar
+
+import metrics
+from ai.schemas import SchemaError
+from settings import env_float, env_str
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+ACCEPTED = "accepted"
+LOW_CONFIDENCE = "low_confidence"
+INVALID = "invalid"
+
+
+class ModelRouter:
+    def __init__(self, name: str, models_env: str, default_models: str, confidence_env: str, default_confidence: float):
+        self.name = name
+        self.models_env = models_env
+        self.default_models = default_models
+        self.confidence_env = confidence_env
+        self.default_confidence = default_confidence
+
+    def models(self) -> List[str]:
+        configured = env_str(self.models_env, self.default_models) or self.default_models
+        models = [model.strip() for model in configured.split(",") if model.strip()]
+        return models or [model.strip() for model in self.default_models.split(",")]
+
+    def run(self, attempt: Callable[[str], T], start: int = 0) -> T:
+        """Calls `attempt(model)` for each tier from `start` until one gives an acceptable answer."""
+        models = self._from(start)
+        for index, model in enumerate(models):
+            started = time.monotonic()
+            try:
+                result = attempt(model)
+            except SchemaError:
+                self._record(model, started, INVALID, final=index == len(models) - 1)
+                if index == len(models) - 1:
+                    raise
+                continue
+            if self._accept(model, started, result, final=index == len(models) - 1):
+                return result
+        raise AssertionError("unreachable: the last tier always accepts")
+
+    async def run_async(self, attempt: Callable[[str], Awaitable[T]], start: int = 0) -> T:
+        models = self._from(start)
+        for index, model in enumerate(models):
+            started = time.monotonic()
+            try:
+                result = await attempt(model)
+            except SchemaError:
+                self._record(model, started, INVALID, final=index == len(models) - 1)
+                if index == len(models) - 1:
+                    raise
+                continue
+            if self._accept(model, started, result, final=index == len(models) - 1):
+                return result
+        raise AssertionError("unreachable: the last tier always accepts")
+
+    def _from(self, start: int) -> List[str]:
+        # The last tier is always tried, however far `start` points.
+        models = self.models()
+        return models[min(max(start, 0), len(models) - 1):]
+
+    def is_confident(self, result: Any) -> bool:
+        confidence = result.get("confidence") if isinstance(result, dict) else None
+        if not isinstance(confidence, (int, float)):
+            return True
+        return confidence >= env_float(self.confidence_env, self.default_confidence)
+
+    def can_escalate(self) -> bool:
+        return len(self.models()) > 1
+
+    def _accept(self, model: str, started: float, result: Any, final: bool) -> bool:
+        accepted = final or self.is_confident(result)
+        self._record(model, started, ACCEPTED if accepted else LOW_CONFIDENCE, final)
+        return accepted
+
+    def _record(self, model: str, started: float, outcome: str, final: bool):
+        elapsed_ms = (time.monotonic() - started) * 1000
+        action = "done" if outcome == ACCEPTED or final else "escalating"
+        logger.info("%s router: %s -> %s in %.0f ms, %s", self.name, model, outcome, elapsed_ms, action)
+        prefix = f"{self.name}.router.{model}"
+        metrics.increment(f"{prefix}.calls")
+        metrics.increment(f"{prefix}.{outcome}")
+        metrics.increment(f"{prefix}.latency_ms", int(elapsed_ms))
@@ -0,0 +1,169 @@
+"""
+Deterministic pre-classifier that answers obvious messages without calling OpenAI.
+
+Rules are regexes anchored at the start of the message ("todo ...", "need to ...",
+"idea: ...") plus a length check for pasted text dumps. Each rule has a
+confidence; only matches at or above PRECLASSIFIER_MIN_CONFIDENCE short-circuit,
+everything else falls through to the LLM. PRECLASSIFIER_RULES_FILE may point to
+a JSON list of {"type", "pattern", "confidence", "strip_prefix"} objects that
+replaces the built-in rules.
+"""
+import json
+import logging
+import re
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Pattern
+
+import metrics
+from settings import env_bool, env_float, env_int, env_str
+
+logger = logging.getLogger(__name__)
+
+metrics.define_rate("preclassifier.hit_rate", "preclassifier.hit", "preclassifier.lookup")
+
+
+class Rule(NamedTuple):
+    type: str
+    pattern: Pattern[str]
+    confidence: float
+    strip_prefix: bool
+
+
+DEFAULT_RULES: List[Dict[str, Any]] = [
+    {"type": "task", "pattern": r"^(?:todo|to-do|to do)\b[\s:,\-]*", "confidence": 0.95, "strip_prefix": True},
+    {
+        "type": "task",
+        "pattern": r"^(?:i\s+)?(?:need to|have to|must)\s+",
+        "confidence": 0.9,
+        "strip_prefix": False,
+    },
+    {
+        "type": "task",
+        "pattern": r"^(?:remind me(?: to)?|remember to|don'?t forget to)\s+",
+        "confidence": 0.9,
+        "strip_prefix": True,
+    },
+    {"type": "idea", "pattern": r"^(?:\w+\s+)?idea\s*[:\-]\s*", "confidence": 0.9, "strip_prefix": True},
+    {"type": "idea", "pattern": r"^what if\b", "confidence": 0.75, "strip_prefix": False},
+    {"type": "note", "pattern": r"^(?:note|fyi|nb)\s*[:\-]\s*", "confidence": 0.9, "strip_prefix": True},
+]
+
+_VALID_TYPES = {"task", "idea", "note"}
+_TITLE_LIMIT = 80
+
+_rules: Optional[List[Rule]] = None
+_rules_lock = threading.Lock()
+
+
+def pre_classify(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns a raw classification payload (same shape the LLM returns) when a rule
+    matches confidently, or None to fall through to the model.
+    """
+    if not env_bool("PRECLASSIFIER_ENABLED", True):
+        return None
+
+    metrics.increment("preclassifier.lookup")
+    clean_text = (text or "").strip()
+    if not clean_text:
+        return None
+
+    threshold = env_float("PRECLASSIFIER_MIN_CONFIDENCE", 0.85)
+    payload = _match_dump(clean_text, threshold) or _match_rules(clean_text, threshold)
+    if payload is not None:
+        metrics.increment("preclassifier.hit")
+        metrics.increment(f"preclassifier.hit.{payload['type']}")
+    return payload
+
+
+def _match_dump(text: str, threshold: float) -> Optional[Dict[str, Any]]:
+    # Long pastes and multi-line dumps are notes; nobody types a to-do that long.
+    is_dump = (
+        len(text) >= env_int("PRECLASSIFIER_DUMP_CHARS", 600, minimum=1)
+        or text.count("\n") + 1 >= env_int("PRECLASSIFIER_DUMP_LINES", 8, minimum=2)
+    )
+    if not is_dump or env_float("PRECLASSIFIER_DUMP_CONFIDENCE", 0.9) < threshold:
+        return None
+    return build_payload("note", text, text)
+
+
+def _match_rules(text: str, threshold: float) -> Optional[Dict[str, Any]]:
+    first_line = text.splitlines()[0].strip()
+    # "Must we ship Friday?" is a question for the model, not a to-do.
+    is_question = first_line.endswith("?")
+    for rule in _get_rules():
+        if rule.confidence < threshold or (is_question and rule.type == "task"):
+            continue
+        match = rule.pattern.match(first_line)
+        if not match:
+            continue
+        remainder = first_line[match.end():].strip() if rule.strip_prefix else first_line
+        if not remainder:
+            continue
+        return build_payload(rule.type, remainder, text)
+    return None
+
+
+def build_payload(result_type: str, title_source: str, text: str) -> Dict[str, Any]:
+    """Shapes a locally decided label like an LLM answer, titled from `title_source`."""
+    title = _clip_title(title_source)
+    rest = text.split("\n", 1)[1].strip() if "\n" in text else ""
+    payload: Dict[str, Any] = {"type": result_type, "task": None, "idea": None, "note": None}
+    if result_type == "task":
+        payload["task"] = {"title": title, "details": rest, "deadline": None, "tags": [], "estimated_minutes": None}
+    elif result_type == "idea":
+        payload["idea"] = {"title": title, "details": rest, "tags": []}
+    else:
+        payload["note"] = {"title": None, "content": text, "tags": []}
+    return payload
+
+
+def _clip_title(text: str) -> str:
+    title = text.splitlines()[0].strip().rstrip(".!")
+    if len(title) > _TITLE_LIMIT:
+        title = f"{title[: _TITLE_LIMIT - 3].rstrip()}..."
+    return title[:1].upper() + title[1:]
+
+
+def _get_rules() -> List[Rule]:
+    global _rules
+    if _rules is None:
+        with _rules_lock:
+            if _rules is None:
+                _rules = _compile_rules(_load_rule_specs())
+    return _rules
+
+
+def _load_rule_specs() -> List[Dict[str, Any]]:
+    path = env_str("PRECLASSIFIER_RULES_FILE")
+    if not path:
+        return DEFAULT_RULES
+    try:
+        with open(path, encoding="utf-8") as handle:
+            specs = json.load(handle)
+        if not isinstance(specs, list):
+            raise ValueError("rules file must contain a JSON list")
+        return specs
+    except (OSError, ValueError) as exc:
+        logger.error("Could not load pre-classifier rules from %s, using defaults: %s", path, exc)
+        return DEFAULT_RULES
+
+
+def _compile_rules(specs: List[Dict[str, Any]]) -> List[Rule]:
+    rules = []
+    for spec in specs:
+        try:
+            rule_type = spec["type"]
+            if rule_type not in _VALID_TYPES:
+                raise ValueError(f"invalid type {rule_type!r}")
+            rules.append(
+                Rule(
+                    type=rule_type,
+                    pattern=re.compile(spec["pattern"], re.IGNORECASE),
+                    confidence=float(spec.get("confidence", 1.0)),
+                    strip_prefix=bool(spec.get("strip_prefix", False)),
+                )
+            )
+        except (KeyError, TypeError, ValueError, re.error) as exc:
+            logger.warning("Skipping invalid pre-classifier rule %s: %s", spec, exc)
+    return rules
@@ -0,0 +1,195 @@
+"""
+JSON schemas for the model's structured outputs, plus a small validator compiler.
+
+Requests pass these schemas as `text={"format": {"type": "json_schema", ..., "strict": True}}`
+so the API constrains decoding to them. Replies are still checked locally with
+validators compiled once at import: each schema node becomes a closure, so
+validation is a walk over the payload with no schema interpretation per call.
+Only the keywords these schemas use are supported.
+"""
+import json
+from typing import Any, Callable, Dict, List
+
+import metrics
+
+Validator = Callable[[Any, str], None]
+
+
+class SchemaError(ValueError):
+    """Raised when a model reply does not match its schema."""
+
+
+_TYPE_CHECKS: Dict[str, Callable[[Any], bool]] = {
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+    "string": lambda value: isinstance(value, str),
+    "integer": lambda value: isinstance(value, int) and not isinstance(value, bool),
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "boolean": lambda value: isinstance(value, bool),
+    "null": lambda value: value is None,
+}
+
+
+def compile_validator(schema: Dict[str, Any]) -> Callable[[Any], None]:
+    """Turns `schema` into a function that raises SchemaError on mismatching values."""
+    validate = _compile(schema)
+    return lambda value: validate(value, "$")
+
+
+def _compile(schema: Dict[str, Any]) -> Validator:
+    checks: List[Validator] = []
+
+    if "anyOf" in schema:
+        options = [_compile(option) for option in schema["anyOf"]]
+
+        def any_of(value: Any, path: str):
+            for option in options:
+                try:
+                    option(value, path)
+                    return
+                except SchemaError:
+                    continue
+            raise SchemaError(f"{path}: matches none of the allowed shapes")
+
+        checks.append(any_of)
+
+    if "type" in schema:
+        names = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+        type_checks = [_TYPE_CHECKS[name] for name in names]
+        expected = " or ".join(names)
+
+        def check_type(value: Any, path: str):
+            if not any(check(value) for check in type_checks):
+                raise SchemaError(f"{path}: expected {expected}, got {type(value).__name__}")
+
+        checks.append(check_type)
+
+    if "enum" in schema:
+        allowed = frozenset(schema["enum"])
+
+        def check_enum(value: Any, path: str):
+            if value not in allowed:
+                raise SchemaError(f"{path}: {value!r} is not one of {sorted(allowed)}")
+
+        checks.append(check_enum)
+
+    if "properties" in schema:
+        properties = {name: _compile(sub) for name, sub in schema["properties"].items()}
+        required = tuple(schema.get("required", ()))
+        closed = schema.get("additionalProperties") is False
+
+        def check_properties(value: Any, path: str):
+            if not isinstance(value, dict):
+                return
+            for name in required:
+                if name not in value:
+                    raise SchemaError(f"{path}: missing {name!r}")
+            for name, item in value.items():
+                validate = properties.get(name)
+                if validate is not None:
+                    validate(item, f"{path}.{name}")
+                elif closed:
+                    raise SchemaError(f"{path}: unexpected {name!r}")
+
+        checks.append(check_properties)
+
+    if "items" in schema:
+        validate_item = _compile(schema["items"])
+
+        def check_items(value: Any, path: str):
+            if isinstance(value, list):
+                for index, item in enumerate(value):
+                    validate_item(item, f"{path}[{index}]")
+
+        checks.append(check_items)
+
+    def validate(value: Any, path: str):
+        for check in checks:
+            check(value, path)
+
+    return validate
+
+
+def parse_json(text: str, validator: Callable[[Any], None], metric: str) -> Any:
+    """
+    Decodes and validates a model reply. Failures are counted under `{metric}.parse_failures`
+    and re-raised as SchemaError.
+    """
+    try:
+        value = json.loads(text)
+        validator(value)
+    except (ValueError, TypeError) as exc:
+        metrics.increment(f"{metric}.parse_failures")
+        raise exc if isinstance(exc, SchemaError) else SchemaError(f"invalid JSON: {exc}") from exc
+    return value
+
+
+def response_format(name: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+    """The Responses API `text` parameter that enforces `schema`."""
+    return {"format": {"type": "json_schema", "name": name, "schema": schema, "strict": True}}
+
+
+def _object(properties: Dict[str, Any]) -> Dict[str, Any]:
+    # Strict mode requires every property to be listed and no extras.
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+
+def _nullable(schema: Dict[str, Any]) -> Dict[str, Any]:
+    return {"anyOf": [schema, {"type": "null"}]}
+
+
+_TAGS = {"type": "array", "items": {"type": "string"}}
+
+_TASK_FIELDS = {
+    "title": {"type": "string"},
+    "details": {"type": "string"},
+    "deadline": {"type": ["string", "null"]},
+    "tags": _TAGS,
+    "estimated_minutes": {"type": ["integer", "null"]},
+}
+
+_SCORE_FIELDS = {
+    "importance": {"type": "integer"},
+    "urgency": {"type": "integer"},
+    "reason": {"type": "string"},
+}
+
+# Self-reported certainty in [0, 1]; ModelRouter escalates to a stronger model when it is low.
+_CONFIDENCE = {"type": "number"}
+
+_IDEA = _object({"title": {"type": "string"}, "details": {"type": "string"}, "tags": _TAGS})
+_NOTE = _object({"title": {"type": ["string", "null"]}, "content": {"type": "string"}, "tags": _TAGS})
+
+
+def _classification_fields(scored: bool) -> Dict[str, Any]:
+    task = _object({**_TASK_FIELDS, **_SCORE_FIELDS} if scored else _TASK_FIELDS)
+    return {
+        "type": {"type": "string", "enum": ["task", "idea", "note"]},
+        "task": _nullable(task),
+        "idea": _nullable(_IDEA),
+        "note": _nullable(_NOTE),
+        "confidence": _CONFIDENCE,
+    }
+
+
+def _batch(scored: bool) -> Dict[str, Any]:
+    item = _object({"id": {"type": "integer"}, **_classification_fields(scored)})
+    return _object({"items": {"type": "array", "items": item}})
+
+
+CLASSIFICATION_SCHEMA = _object(_classification_fields(scored=False))
+SCORED_CLASSIFICATION_SCHEMA = _object(_classification_fields(scored=True))
+CLASSIFICATION_BATCH_SCHEMA = _batch(scored=False)
+SCORED_CLASSIFICATION_BATCH_SCHEMA = _batch(scored=True)
+TASK_ANALYSIS_SCHEMA = _object({**_SCORE_FIELDS, "confidence": _CONFIDENCE})
+
+validate_classification = compile_validator(CLASSIFICATION_SCHEMA)
+validate_scored_classification = compile_validator(SCORED_CLASSIFICATION_SCHEMA)
+validate_classification_batch = compile_validator(CLASSIFICATION_BATCH_SCHEMA)
+validate_scored_classification_batch = compile_validator(SCORED_CLASSIFICATION_BATCH_SCHEMA)
+validate_task_analysis = compile_validator(TASK_ANALYSIS_SCHEMA)
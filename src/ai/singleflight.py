@@ -0,0 +1,76 @@
+"""
+Coalesces identical in-flight calls so concurrent duplicates share one upstream request.
+
+The first caller for a key (the leader) runs the call; everyone else arriving
+before it finishes waits on the leader's `concurrent.futures.Future`. Because the
+future is thread-safe, a coroutine on the event loop and a worker thread in an
+executor can share the same call. Followers receive a deep copy of the result so
+no caller can mutate another's answer.
+"""
+import asyncio
+import copy
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+import metrics
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args: Any) -> Any:
+        """Blocking variant for worker threads and synchronous callers."""
+        future, leader = self._join(key)
+        if not leader:
+            return copy.deepcopy(future.result())
+        try:
+            result = fn(*args)
+        except BaseException as exc:
+            self._finish(key, future, error=exc)
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Event-loop variant. The shared call runs in its own task, so a cancelled
+        caller, leader or follower, stops waiting without cancelling it for the rest.
+        """
+        future, leader = self._join(key)
+        if not leader:
+            return copy.deepcopy(await asyncio.shield(asyncio.wrap_future(future)))
+        task = asyncio.ensure_future(fn())
+        task.add_done_callback(lambda done: self._finish_task(key, future, done))
+        return await asyncio.shield(task)
+
+    def _join(self, key: Hashable) -> Tuple[Future, bool]:
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                metrics.increment(f"{self.name}.singleflight.shared")
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            metrics.increment(f"{self.name}.singleflight.leader")
+            return future, True
+
+    def _finish(self, key: Hashable, future: Future, result: Any = None, error: Optional[BaseException] = None):
+        # Unregister first so callers arriving from now on start a fresh call.
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _finish_task(self, key: Hashable, future: Future, task: "asyncio.Future[Any]"):
+        if task.cancelled():
+            self._finish(key, future, error=asyncio.CancelledError())
+        elif task.exception() is not None:
+            self._finish(key, future, error=task.exception())
+        else:
+            self._finish(key, future, result=task.result())
@@ -1,9 +1,15 @@
 import json
 import logging
-import os
 from typing import Any, Dict, Optional
 
-from openai import OpenAI
+from openai import APIConnectionError, InternalServerError, RateLimitError
+
+from ai.breaker import get_breaker
+from ai.client import get_client
+from ai.router import ModelRouter
+from ai.schemas import TASK_ANALYSIS_SCHEMA, parse_json, response_format, validate_task_analysis
+from ai.singleflight import SingleFlight
+from executors import get_executor
 
 logger = logging.getLogger(__name__)
 
@@ -19,54 +25,109 @@ Return JSON ONLY:
 {
   "importance": 1,
   "urgency": 1,
-  "reason": "explain briefly the scores"
+  "reason": "explain briefly the scores",
+  "confidence": 0.9
 }
+
+Set "confidence" to how sure you are of the scores, from 0 to 1.
 """.strip()
 
 DEFAULT_RESPONSE = {"importance": 3, "urgency": 3, "reason": "ai_fallback"}
 
+# APITimeoutError is a subclass of APIConnectionError.
+TRANSIENT_ERRORS = (APIConnectionError, RateLimitError, InternalServerError)
+
 
-def analyze_task(task_title: str, details: str, deadline: Optional[str]) -> Dict[str, Any]:
+def analyze_task(
+    task_title: str,
+    details: str,
+    deadline: Optional[str],
+    fallback: bool = True,
+) -> Dict[str, Any]:
     """
     Calls OpenAI and returns task scoring metadata.
-    Retries once on JSON failure before falling back.
+    The reply is schema-constrained, so only transport errors (connection drops,
+    timeouts, rate limits, 5xx) are retried; anything else falls back at once.
+    With `fallback=False` the last error is raised instead of returning
+    DEFAULT_RESPONSE, for callers that retry later themselves.
+    Concurrent calls for the same task share one request. ANALYSIS_MODELS lists the
+    models to try, cheapest first; see `ai.router`.
+    """
+    payload = _payload(task_title, details, deadline)
+    return _inflight.do(_flight_key(payload, fallback), _analyze, payload, fallback)
+
+
+async def analyze_task_async(
+    task_title: str,
+    details: str,
+    deadline: Optional[str],
+    fallback: bool = True,
+) -> Dict[str, Any]:
     """
-    payload = {
+    Runs `analyze_task` on the `llm` executor. Duplicates are coalesced before
+    they take an executor thread, and also with blocking callers of `analyze_task`.
+    """
+    payload = _payload(task_title, details, deadline)
+    return await _inflight.do_async(
+        _flight_key(payload, fallback),
+        lambda: get_executor("llm").run(_analyze, payload, fallback),
+    )
+
+
+def priority_score(importance: int, urgency: int) -> float:
+    """The ranking used for task lists: importance weighs 60%, urgency 40%."""
+    return round(importance * 0.6 + urgency * 0.4, 2)
+
+
+_inflight = SingleFlight("task_analysis")
+_router = ModelRouter("task_analysis", "ANALYSIS_MODELS", "gpt-4.1-mini,gpt-4.1", "ANALYSIS_MIN_CONFIDENCE", 0.6)
+
+
+def _payload(task_title: str, details: str, deadline: Optional[str]) -> Dict[str, Any]:
+    return {
         "title": task_title,
         "details": details,
         "deadline": deadline,
     }
 
+
+def _flight_key(payload: Dict[str, Any], fallback: bool) -> str:
+    return json.dumps([payload, fallback], ensure_ascii=False, sort_keys=True)
+
+
+def _analyze(payload: Dict[str, Any], fallback: bool = True) -> Dict[str, Any]:
     attempts = 0
     last_error: Optional[Exception] = None
 
     while attempts < 2:
         attempts += 1
         try:
-            response = _call_openai(payload)
-            parsed = json.loads(response)
+            parsed = _router.run(
+                lambda model: parse_json(_call_openai(payload, model), validate_task_analysis, "task_analysis")
+            )
             return _normalize(parsed)
-        except Exception as exc:
+        except TRANSIENT_ERRORS as exc:
             last_error = exc
             logger.warning("Task analysis attempt %s failed: %s", attempts, exc)
+        except Exception as exc:
+            last_error = exc
+            break
 
-    logger.error("Task analysis failed after retries: %s", last_error)
+    if not fallback:
+        raise last_error
+    logger.error("Task analysis failed, using default scores: %s", last_error)
     return DEFAULT_RESPONSE.copy()
 
 
-def _call_openai(payload: Dict[str, Any]) -> str:
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise RuntimeError("OPENAI_API_KEY is not set.")
-
-    client = OpenAI(api_key=api_key)
-
-    response = client.responses.create(
-        model="gpt-4.1",
+def _call_openai(payload: Dict[str, Any], model: str) -> str:
+    response = get_breaker().call(
+        get_client().responses.create,
+        model=model,
         input=[
             {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
         ],
+        text=response_format("task_analysis", TASK_ANALYSIS_SCHEMA),
     )
 
     text = _extract_text(response)
@@ -0,0 +1,192 @@
+"""
+Durable queue that scores tasks in the background.
+
+Every task saved without scores gets a row in `analysis_jobs`. A pool of
+ANALYSIS_WORKERS coroutines leases due jobs, runs `analyze_task`, writes the scores
+with `update_task_analysis` and deletes the job. While a job runs its worker renews
+the lease every third of ANALYSIS_LEASE_SECONDS; a job whose worker dies keeps its
+lease until ANALYSIS_LEASE_SECONDS pass and is then picked up again; failed
+attempts back off exponentially, and after ANALYSIS_MAX_ATTEMPTS the task gets the
+default scores and the job is marked failed. On startup, leases left by the
+previous process are released and tasks with a NULL `priority_score` are queued.
+
+Handlers that want the scores await the future returned by `submit`, or by
+`watch` when the job was written together with its task (`save_task_with_job`);
+it fails with AnalysisFailedError when the job gives up.
+"""
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+import metrics
+from ai.task_analysis import DEFAULT_RESPONSE, analyze_task_async, priority_score
+from async_db import (
+    enqueue_analysis_job,
+    fail_analysis_job,
+    finish_analysis_job,
+    lease_analysis_job,
+    renew_analysis_lease,
+    retry_analysis_job,
+    update_task_analysis,
+)
+from db import recover_analysis_jobs
+from settings import env_float, env_int
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisFailedError(RuntimeError):
+    """Set on a submit future when the job gave up; the task then has the default scores."""
+
+
+class AnalysisQueue:
+    def __init__(self, workers: int, lease_seconds: float, max_attempts: int, poll_seconds: float):
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_seconds = poll_seconds
+        self._waiters: Dict[int, List[asyncio.Future]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        released, enqueued = recover_analysis_jobs()
+        if released or enqueued:
+            logger.info("Recovered %s leased and %s unscored analysis job(s)", released, enqueued)
+        self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        self._tasks = [asyncio.ensure_future(self._worker(index)) for index in range(self.workers)]
+        logger.info("Started %s analysis worker(s)", self.workers)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for waiters in self._waiters.values():
+            for future in waiters:
+                if not future.done():
+                    future.cancel()
+        self._waiters.clear()
+
+    async def submit(self, task_id: int, details: Optional[str]) -> asyncio.Future:
+        """
+        Persists a job for `task_id` and returns a future resolved with the stored
+        analysis (importance, urgency, reason, priority_score).
+        """
+        await enqueue_analysis_job(task_id, details)
+        return self.watch(task_id)
+
+    def watch(self, task_id: int) -> asyncio.Future:
+        """Returns a future for the outcome of the already persisted job for `task_id`."""
+        future = asyncio.get_running_loop().create_future()
+        # Mark the outcome as retrieved so an abandoned waiter does not log a warning.
+        future.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self._waiters.setdefault(task_id, []).append(future)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return future
+
+    async def _worker(self, index: int):
+        while True:
+            # Cleared before leasing, so a submit that lands in between is not missed.
+            self._wakeup.clear()
+            job = await lease_analysis_job(self.lease_seconds)
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            # Let sibling workers pick up the next job while this one runs.
+            self._wakeup.set()
+            heartbeat = asyncio.ensure_future(self._renew_lease(job["id"]))
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # The lease expires and the job is retried; keep the worker alive.
+                logger.exception("Analysis worker %s failed on job %s", index, job["id"])
+            finally:
+                heartbeat.cancel()
+
+    async def _renew_lease(self, job_id: int):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await renew_analysis_lease(job_id, self.lease_seconds)
+            except Exception as exc:
+                logger.warning("Could not renew the lease on analysis job %s: %s", job_id, exc)
+
+    async def _run(self, job: Dict[str, Any]):
+        task_id = job["task_id"]
+        try:
+            analysis = await analyze_task_async(
+                job["title"],
+                job["details"] or job["description"] or job["title"],
+                job["deadline"],
+                fallback=False,
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            if job["attempts"] < self.max_attempts:
+                delay = self._backoff(job["attempts"])
+                logger.warning(
+                    "Analysis of task %s failed (attempt %s), retrying in %.1fs: %s",
+                    task_id, job["attempts"], delay, exc,
+                )
+                metrics.increment("analysis_queue.retried")
+                await retry_analysis_job(job["id"], delay, str(exc))
+                return
+            logger.error("Analysis of task %s failed after %s attempts: %s", task_id, job["attempts"], exc)
+            metrics.increment("analysis_queue.failed")
+            await self._store(task_id, DEFAULT_RESPONSE)
+            await fail_analysis_job(job["id"], str(exc))
+            self._resolve(task_id, error=AnalysisFailedError(f"analysis of task {task_id} failed: {exc}"))
+            return
+
+        result = await self._store(task_id, analysis)
+        await finish_analysis_job(job["id"])
+        metrics.increment("analysis_queue.completed")
+        self._resolve(task_id, result)
+
+    async def _store(self, task_id: int, analysis: Dict[str, Any]) -> Dict[str, Any]:
+        score = priority_score(analysis["importance"], analysis["urgency"])
+        await update_task_analysis(task_id, analysis["importance"], analysis["urgency"], analysis["reason"], score)
+        return {**analysis, "priority_score": score}
+
+    def _resolve(
+        self,
+        task_id: int,
+        result: Optional[Dict[str, Any]] = None,
+        error: Optional[Exception] = None,
+    ):
+        for future in self._waiters.pop(task_id, []):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def _backoff(self, attempts: int) -> float:
+        base = env_float("ANALYSIS_RETRY_BASE_SECONDS", 5.0, minimum=0.0)
+        cap = env_float("ANALYSIS_RETRY_MAX_SECONDS", 300.0, minimum=0.0)
+        return min(cap, base * 2 ** (attempts - 1))
+
+
+_queue: Optional[AnalysisQueue] = None
+
+
+def get_analysis_queue() -> AnalysisQueue:
+    global _queue
+    if _queue is None:
+        _queue = AnalysisQueue(
+            workers=env_int("ANALYSIS_WORKERS", 2, minimum=1),
+            lease_seconds=env_float("ANALYSIS_LEASE_SECONDS", 120.0, minimum=1.0),
+            max_attempts=env_int("ANALYSIS_MAX_ATTEMPTS", 5, minimum=1),
+            poll_seconds=env_float("ANALYSIS_POLL_SECONDS", 5.0, minimum=0.1),
+        )
+    return _queue
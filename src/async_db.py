@@ -0,0 +1,92 @@
+"""
+Awaitable facade over the `db` module for code running on the event loop.
+
+Every function here has the same name and arguments as its `db` counterpart and
+returns the same value. Reads run on the `db_reader` pool: WAL mode lets several
+readers proceed while a write is in progress. Writes go to the single
+group-commit thread in `db_writer`, so they never compete for SQLite's write lock
+with each other, writes arriving together share one commit, and a slow or locked
+write holds up other writes only, never the loop or reads.
+
+Functions that mix a read with a write (`snooze_task_deadline`, the
+`delete_*_by_positions` helpers) count as writes.
+"""
+import asyncio
+import functools
+from typing import Any, Callable, TypeVar
+
+import db
+from db_writer import get_db_writer
+from executors import get_executor
+
+T = TypeVar("T")
+
+
+async def read(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Runs a read-only `fn` on the reader pool."""
+    return await get_executor("db_reader").run(functools.partial(fn, *args, **kwargs))
+
+
+async def write(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Runs `fn` in the writer's next group commit."""
+    return await asyncio.wrap_future(get_db_writer().submit(functools.partial(fn, *args, **kwargs)))
+
+
+def _reader(fn: Callable[..., T]) -> Callable[..., Any]:
+    @functools.wraps(fn)
+    async def call(*args: Any, **kwargs: Any) -> T:
+        return await read(fn, *args, **kwargs)
+
+    return call
+
+
+def _writer(fn: Callable[..., T]) -> Callable[..., Any]:
+    @functools.wraps(fn)
+    async def call(*args: Any, **kwargs: Any) -> T:
+        return await write(fn, *args, **kwargs)
+
+    return call
+
+
+get_tasks_by_user = _reader(db.get_tasks_by_user)
+get_ideas_by_user = _reader(db.get_ideas_by_user)
+get_notes_by_user = _reader(db.get_notes_by_user)
+get_tasks_uncompleted = _reader(db.get_tasks_uncompleted)
+get_tasks_completed = _reader(db.get_tasks_completed)
+get_all_tasks = _reader(db.get_all_tasks)
+get_all_ideas = _reader(db.get_all_ideas)
+get_all_notes = _reader(db.get_all_notes)
+get_tasks_by_priority = _reader(db.get_tasks_by_priority)
+get_tasks_due_today_or_high_priority = _reader(db.get_tasks_due_today_or_high_priority)
+get_task_by_id = _reader(db.get_task_by_id)
+get_idea_by_id = _reader(db.get_idea_by_id)
+get_note_by_id = _reader(db.get_note_by_id)
+search_tasks = _reader(db.search_tasks)
+search_ideas = _reader(db.search_ideas)
+search_notes = _reader(db.search_notes)
+search_all = _reader(db.search_all)
+get_cached_classification = _reader(db.get_cached_classification)
+
+save_task = _writer(db.save_task)
+save_task_with_job = _writer(db.save_task_with_job)
+save_idea = _writer(db.save_idea)
+save_note = _writer(db.save_note)
+update_task_analysis = _writer(db.update_task_analysis)
+update_task_status = _writer(db.update_task_status)
+snooze_task_deadline = _writer(db.snooze_task_deadline)
+delete_all_tasks = _writer(db.delete_all_tasks)
+delete_all_ideas = _writer(db.delete_all_ideas)
+delete_all_notes = _writer(db.delete_all_notes)
+delete_tasks_by_ids = _writer(db.delete_tasks_by_ids)
+delete_ideas_by_ids = _writer(db.delete_ideas_by_ids)
+delete_notes_by_ids = _writer(db.delete_notes_by_ids)
+delete_tasks_by_positions = _writer(db.delete_tasks_by_positions)
+delete_ideas_by_positions = _writer(db.delete_ideas_by_positions)
+delete_notes_by_positions = _writer(db.delete_notes_by_positions)
+enqueue_analysis_job = _writer(db.enqueue_analysis_job)
+lease_analysis_job = _writer(db.lease_analysis_job)
+renew_analysis_lease = _writer(db.renew_analysis_lease)
+finish_analysis_job = _writer(db.finish_analysis_job)
+retry_analysis_job = _writer(db.retry_analysis_job)
+fail_analysis_job = _writer(db.fail_analysis_job)
+put_cached_classification = _writer(db.put_cached_classification)
@@ -3,11 +3,12 @@ import json
 import os
 import logging
 import re
-from typing import Any, Dict, Iterable, List, Optional, Tuple
+from typing import Any, Iterable, List, Optional, Set, Tuple
 
 from dotenv import load_dotenv
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.constants import ParseMode
+from telegram.error import TelegramError
 from telegram.ext import (
     Application,
     CallbackQueryHandler,
@@ -17,18 +18,21 @@ from telegram.ext import (
     filters,
 )
 
-from ai.classifier import classify_message
-from ai.task_analysis import analyze_task
-from db import (
+import metrics
+from ai.breaker import CircuitOpenError
+from ai.cache import get_cache
+from ai.classifier import classify_message_async, classify_offline
+from ai.client import close_clients
+from ai.offline import get_offline_model
+from ai.task_analysis import priority_score
+from analysis_queue import AnalysisFailedError, get_analysis_queue
+from async_db import (
     delete_all_ideas,
     delete_all_notes,
     delete_all_tasks,
-    delete_ideas_by_ids,
-    delete_notes_by_ids,
-    delete_tasks_by_ids,
-    get_all_ideas,
-    get_all_notes,
-    get_all_tasks,
+    delete_ideas_by_positions,
+    delete_notes_by_positions,
+    delete_tasks_by_positions,
     get_idea_by_id,
     get_ideas_by_user,
     get_note_by_id,
@@ -37,18 +41,20 @@ from db import (
     get_tasks_by_user,
     get_tasks_completed,
     get_tasks_uncompleted,
-    init_db,
+    read,
     save_idea,
     save_note,
     save_task,
-    search_ideas,
-    search_notes,
-    search_tasks,
+    save_task_with_job,
+    search_all,
     snooze_task_deadline,
-    update_task_analysis,
     update_task_status,
 )
+from db import SNIPPET_END, SNIPPET_START, close_db_connections, init_db
+from db_writer import start_db_writer, stop_db_writer
+from executors import shutdown_executors, start_executors
 from services.suggestions import get_today_tasks, get_top_tasks
+from settings import env_float
 
 load_dotenv()
 
@@ -107,7 +113,7 @@ async def review_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     filter_token, page = _parse_task_args(context.args)
 
-    text, keyboard, empty_msg = _build_task_list_message(user_id, filter_token, page)
+    text, keyboard, empty_msg = await _build_task_list_message(user_id, filter_token, page)
     if not text:
         await update.message.reply_text(empty_msg)
         return
@@ -123,7 +129,7 @@ async def review_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def review_ideas(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     page = _parse_page_arg(context.args)
-    text, keyboard, empty_msg = _build_idea_list_message(user_id, page)
+    text, keyboard, empty_msg = await _build_idea_list_message(user_id, page)
 
     if not text:
         await update.message.reply_text(empty_msg)
@@ -140,7 +146,7 @@ async def review_ideas(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def review_notes(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     page = _parse_page_arg(context.args)
-    text, keyboard, empty_msg = _build_note_list_message(user_id, page)
+    text, keyboard, empty_msg = await _build_note_list_message(user_id, page)
 
     if not text:
         await update.message.reply_text(empty_msg)
@@ -156,13 +162,13 @@ async def review_notes(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def suggest(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    tasks = get_top_tasks(user_id, limit=5)
+    tasks = await read(get_top_tasks, user_id, limit=5)
     await _send_task_suggestions(update, tasks, empty_message="No tasks available for suggestions yet.")
 
 
 async def suggest_today(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    tasks = get_today_tasks(user_id, limit=5)
+    tasks = await read(get_today_tasks, user_id, limit=5)
     await _send_task_suggestions(update, tasks, empty_message="No tasks match today's focus.")
 
 
@@ -207,9 +213,10 @@ async def search(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     user_id = update.effective_user.id
-    tasks = search_tasks(user_id, query, limit=5)
-    ideas = search_ideas(user_id, query, limit=5)
-    notes = search_notes(user_id, query, limit=5)
+    hits = await search_all(user_id, query, per_type_limit=5, limit=15)
+    tasks = [hit for hit in hits if hit["type"] == "task"]
+    ideas = [hit for hit in hits if hit["type"] == "idea"]
+    notes = [hit for hit in hits if hit["type"] == "note"]
 
     if not any([tasks, ideas, notes]):
         await message.reply_text(f"No matches found for \"{query}\".")
@@ -223,6 +230,7 @@ async def search(update: Update, context: ContextTypes.DEFAULT_TYPE):
         for task in tasks:
             title = _escape_markdown(task.get("title") or "Untitled")
             lines.append(f"• {title} (ID: {task['id']})")
+            lines.extend(_format_search_snippet(task))
         lines.append("")
 
     if ideas:
@@ -230,6 +238,7 @@ async def search(update: Update, context: ContextTypes.DEFAULT_TYPE):
         for idea in ideas:
             title = _escape_markdown(idea.get("title") or "Untitled")
             lines.append(f"• {title} (ID: {idea['id']})")
+            lines.extend(_format_search_snippet(idea))
         lines.append("")
 
     if notes:
@@ -237,6 +246,7 @@ async def search(update: Update, context: ContextTypes.DEFAULT_TYPE):
         for note in notes:
             title = _escape_markdown(note.get("title") or f"Note #{note['id']}")
             lines.append(f"• {title} (ID: {note['id']})")
+            lines.extend(_format_search_snippet(note))
 
     text = "\n".join(line for line in lines if line is not None)
     await message.reply_text(text, parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
@@ -246,9 +256,8 @@ async def clear_task(update: Update, context: ContextTypes.DEFAULT_TYPE):
         update,
         context,
         entity_name="task",
-        fetch_all_fn=get_all_tasks,
         delete_all_fn=delete_all_tasks,
-        delete_ids_fn=delete_tasks_by_ids,
+        delete_positions_fn=delete_tasks_by_positions,
         confirm_key="tasks",
     )
 
@@ -258,9 +267,8 @@ async def clear_idea(update: Update, context: ContextTypes.DEFAULT_TYPE):
         update,
         context,
         entity_name="idea",
-        fetch_all_fn=get_all_ideas,
         delete_all_fn=delete_all_ideas,
-        delete_ids_fn=delete_ideas_by_ids,
+        delete_positions_fn=delete_ideas_by_positions,
         confirm_key="ideas",
     )
 
@@ -270,9 +278,8 @@ async def clear_note(update: Update, context: ContextTypes.DEFAULT_TYPE):
         update,
         context,
         entity_name="note",
-        fetch_all_fn=get_all_notes,
         delete_all_fn=delete_all_notes,
-        delete_ids_fn=delete_notes_by_ids,
+        delete_positions_fn=delete_notes_by_positions,
         confirm_key="notes",
     )
 
@@ -296,14 +303,14 @@ async def handle_task_action(update: Update, context: ContextTypes.DEFAULT_TYPE)
     user_id = query.from_user.id
 
     if action == "accept":
-        if update_task_status(user_id, task_id, "accepted"):
+        if await update_task_status(user_id, task_id, "accepted"):
             await query.message.reply_text("Accepted! I'll schedule it.")
             await query.edit_message_reply_markup(reply_markup=None)
         else:
             await query.message.reply_text("I couldn't find that task.")
 
     elif action == "snooze":
-        new_deadline = snooze_task_deadline(user_id, task_id, days=1)
+        new_deadline = await snooze_task_deadline(user_id, task_id, days=1)
         if new_deadline:
             await query.message.reply_text(f"Snoozed until {new_deadline}.")
             await query.edit_message_reply_markup(reply_markup=None)
@@ -311,7 +318,7 @@ async def handle_task_action(update: Update, context: ContextTypes.DEFAULT_TYPE)
             await query.message.reply_text("Snooze failed. Task not found.")
 
     elif action == "done":
-        if update_task_status(user_id, task_id, "done"):
+        if await update_task_status(user_id, task_id, "done"):
             await query.message.reply_text("Great! Task completed. 🎉")
             await query.edit_message_reply_markup(reply_markup=None)
         else:
@@ -350,7 +357,7 @@ async def handle_clear_confirmation(update: Update, context: ContextTypes.DEFAUL
         return
 
     delete_fn, label = entry
-    delete_fn(query.from_user.id)
+    await delete_fn(query.from_user.id)
     await query.edit_message_text(f"All {label} deleted.")
 
 
@@ -360,8 +367,12 @@ async def handle_pagination(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     try:
-        _, list_type, filter_token, page_str = data.split(":")
+        parts = data.split(":")
+        if len(parts) not in (4, 5):
+            raise ValueError("Unexpected pagination payload.")
+        _, list_type, filter_token, page_str = parts[:4]
         page = max(1, int(page_str))
+        cursor, backward = _decode_page_cursor(parts[4]) if len(parts) == 5 else (None, False)
     except ValueError:
         await query.message.reply_text("Invalid pagination request.")
         return
@@ -369,11 +380,11 @@ async def handle_pagination(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = query.from_user.id
 
     if list_type == "tasks":
-        text, keyboard, empty_msg = _build_task_list_message(user_id, filter_token, page)
+        text, keyboard, empty_msg = await _build_task_list_message(user_id, filter_token, page, cursor=cursor, backward=backward)
     elif list_type == "ideas":
-        text, keyboard, empty_msg = _build_idea_list_message(user_id, page)
+        text, keyboard, empty_msg = await _build_idea_list_message(user_id, page, cursor=cursor, backward=backward)
     else:
-        text, keyboard, empty_msg = _build_note_list_message(user_id, page)
+        text, keyboard, empty_msg = await _build_note_list_message(user_id, page, cursor=cursor, backward=backward)
 
     if not text:
         await query.answer(empty_msg or "No entries for this page.")
@@ -439,11 +450,17 @@ async def _process_incoming_text(update: Update, text: str):
         return
 
     try:
-        classification = classify_message(text)
+        classification = await classify_message_async(text)
     except Exception as exc:
-        logger.error("Classification error: %s", exc, exc_info=True)
-        await _fallback_note(update, user_id, text, reason="AI failed to respond.")
-        return
+        if isinstance(exc, CircuitOpenError):
+            logger.info("OpenAI circuit open, classifying offline")
+        else:
+            logger.error("Classification error: %s", exc, exc_info=True)
+        classification = classify_offline(text)
+        if classification is None:
+            await _fallback_note(update, user_id, text, reason="AI failed to respond.")
+            return
+        metrics.increment("classifier.offline_fallback")
 
     entry_type = (classification or {}).get("type")
     logger.info("Classification result: %s", classification)
@@ -470,24 +487,62 @@ async def _save_task(update: Update, user_id: int, payload: dict, original_text:
     tags = _prepare_tags(payload.get("tags"))
     estimated_minutes = _to_int(payload.get("estimated_minutes"))
 
-    task_id = save_task(user_id, title, description, deadline, tags, estimated_minutes)
-
-    try:
-        analysis = await _analyze_task_async(title, description or original_text, deadline)
-    except Exception as exc:
-        logger.warning("Task analysis failed, using fallback: %s", exc)
-        analysis = {"importance": 3, "urgency": 3, "reason": "ai_fallback"}
-    importance = analysis["importance"]
-    urgency = analysis["urgency"]
-    reason = analysis["reason"]
-    priority_score = round(importance * 0.6 + urgency * 0.4, 2)
-    update_task_analysis(task_id, importance, urgency, reason, priority_score)
+    importance = _to_int(payload.get("importance"))
+    urgency = _to_int(payload.get("urgency"))
 
     deadline_part = f" (deadline: {deadline})" if deadline else ""
     est_part = f" [{estimated_minutes} min]" if estimated_minutes else ""
-    await update.message.reply_text(
-        f"Saved as task: {title}{deadline_part}{est_part} (⭐{importance}/⏳{urgency})"
+    saved_text = f"Saved as task: {title}{deadline_part}{est_part}"
+
+    if importance is not None and urgency is not None:
+        # Scored by the classifier in the same round trip; no second LLM call.
+        reason = payload.get("reason") or "No reason provided."
+        await save_task(
+            user_id, title, description, deadline, tags, estimated_minutes,
+            importance, urgency, reason, priority_score(importance, urgency),
+        )
+        await update.message.reply_text(f"{saved_text} (⭐{importance}/⏳{urgency})")
+        return
+
+    # The task and its analysis job are one write. Reply as soon as it lands,
+    # then edit the scores in when the analysis worker is done.
+    task_id = await save_task_with_job(
+        user_id, title, description, deadline, tags, estimated_minutes, description or original_text,
     )
+    analysis = get_analysis_queue().watch(task_id)
+    reply = await update.message.reply_text(f"{saved_text} (scoring…)")
+    _run_in_background(_edit_with_scores(reply, saved_text, analysis))
+
+
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def _run_in_background(coroutine):
+    # The loop only keeps weak references to tasks; hold them until they finish.
+    task = asyncio.ensure_future(coroutine)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _edit_with_scores(message, saved_text: str, analysis: asyncio.Future):
+    try:
+        result = await asyncio.wait_for(
+            asyncio.shield(analysis),
+            timeout=env_float("ANALYSIS_WAIT_SECONDS", 30.0, minimum=0.0),
+        )
+        text = f"{saved_text} (⭐{result['importance']}/⏳{result['urgency']})"
+    except asyncio.TimeoutError:
+        # The job is durable; the worker will still score the task.
+        text = f"{saved_text} (scoring is taking longer than usual; check /tasks later)"
+    except AnalysisFailedError:
+        text = f"{saved_text} (scoring failed; default priority used)"
+    except asyncio.CancelledError:
+        return
+
+    try:
+        await message.edit_text(text)
+    except TelegramError as exc:
+        logger.warning("Could not edit task reply with scores: %s", exc)
 
 
 async def _save_idea(update: Update, user_id: int, payload: dict, original_text: str):
@@ -495,7 +550,7 @@ async def _save_idea(update: Update, user_id: int, payload: dict, original_text:
     description = payload.get("details") or payload.get("description")
     tags = _prepare_tags(payload.get("tags"))
 
-    save_idea(user_id, title, description, tags)
+    await save_idea(user_id, title, description, tags)
     await update.message.reply_text(f"Saved as idea: {title}")
 
 
@@ -504,14 +559,14 @@ async def _save_note(update: Update, user_id: int, payload: dict, original_text:
     content = payload.get("content") or original_text
     tags = _prepare_tags(payload.get("tags"))
 
-    save_note(user_id, title, content, tags)
+    await save_note(user_id, title, content, tags)
     label = title or _clip_text(content)
     await update.message.reply_text(f"Saved as note: {label}")
 
 
 async def _fallback_note(update: Update, user_id: int, text: str, reason: str):
     logger.warning("Falling back to note storage: %s", reason)
-    save_note(user_id, None, text, None)
+    await save_note(user_id, None, text, None)
     await update.message.reply_text("AI failed to classify, so I saved it as a note.")
 
 
@@ -562,18 +617,12 @@ def _safe_positive_int(value: Any, default: int = 1) -> int:
         return default
 
 
-async def _analyze_task_async(title: str, details: str, deadline: Optional[str]) -> Dict[str, Any]:
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, analyze_task, title, details, deadline)
-
-
 async def _handle_clear_command(
     update: Update,
     context: ContextTypes.DEFAULT_TYPE,
     entity_name: str,
-    fetch_all_fn,
     delete_all_fn,
-    delete_ids_fn,
+    delete_positions_fn,
     confirm_key: str,
 ):
     user_id = update.effective_user.id
@@ -608,20 +657,16 @@ async def _handle_clear_command(
         await update.message.reply_text("Invalid indexes format. Use numbers like 1 or 1,2,3.")
         return
 
-    entities = fetch_all_fn(user_id)
-    if not entities:
+    result = await delete_positions_fn(user_id, indices)
+    if result is None:
         await update.message.reply_text(f"No {entity_name}s found.")
         return
 
-    max_index = len(entities)
-    invalid = [i for i in indices if i < 1 or i > max_index]
+    _, invalid = result
     if invalid:
         await update.message.reply_text(f"Invalid {entity_name} indexes: {invalid}")
         return
 
-    ids_to_delete = [entities[i - 1]["id"] for i in indices]
-    delete_ids_fn(user_id, ids_to_delete)
-
     if len(indices) == 1:
         await update.message.reply_text(f"Deleted: {indices[0]} {entity_name}.")
     else:
@@ -642,6 +687,17 @@ def _escape_markdown(text: Optional[str]) -> str:
     return re.sub(r'([_*[\]()~`>#+\-=|{}.!])', r'\\\1', text)
 
 
+def _format_search_snippet(item: dict) -> List[str]:
+    snippet = item.get("snippet")
+    if not snippet:
+        return []
+    plain = snippet.replace(SNIPPET_START, "").replace(SNIPPET_END, "")
+    if plain.strip() == (item.get("title") or "").strip():
+        return []
+    highlighted = _escape_markdown(snippet).replace(SNIPPET_START, "*").replace(SNIPPET_END, "*")
+    return [f"   {highlighted}"]
+
+
 async def _handle_view_command(update: Update, context: ContextTypes.DEFAULT_TYPE, fetch_fn, entity_name: str, formatter):
     if not context.args:
         await update.message.reply_text(f"Usage: /{entity_name} <id>")
@@ -654,7 +710,7 @@ async def _handle_view_command(update: Update, context: ContextTypes.DEFAULT_TYP
         return
 
     user_id = update.effective_user.id
-    record = fetch_fn(user_id, item_id)
+    record = await fetch_fn(user_id, item_id)
     if not record:
         await update.message.reply_text(f"{entity_name.capitalize()} not found.")
         return
@@ -739,71 +795,108 @@ def _parse_page_arg(args: List[str]) -> int:
     return max(1, _safe_positive_int(args[0], default=1) or 1)
 
 
-def _build_task_list_message(user_id: int, filter_token: str, page: int, limit: int = 10):
-    offset = (page - 1) * limit
+async def _build_task_list_message(
+    user_id: int,
+    filter_token: str,
+    page: int,
+    limit: int = 10,
+    cursor: Optional[Tuple[str, int]] = None,
+    backward: bool = False,
+):
     filter_token = filter_token or "all"
 
     if filter_token == "done":
-        tasks = get_tasks_completed(user_id, limit=limit, offset=offset)
+        fetch_fn = get_tasks_completed
         header = "✅ Completed Tasks"
         empty_msg = "No completed tasks yet."
     elif filter_token == "active":
-        tasks = get_tasks_uncompleted(user_id, limit=limit, offset=offset)
+        fetch_fn = get_tasks_uncompleted
         header = "⏳ Active Tasks (Not Completed)"
         empty_msg = "🎉 No active tasks! All done!"
     else:
-        tasks = get_tasks_by_user(user_id, limit=limit, offset=offset)
+        fetch_fn = get_tasks_by_user
         header = "📋 All Tasks"
         empty_msg = "You have no tasks yet. Send me something todo!"
 
+    tasks, page, has_prev, has_next = await _fetch_page(fetch_fn, user_id, page, limit, cursor, backward)
     if not tasks:
-        msg = empty_msg if offset == 0 else "No tasks on this page."
+        msg = empty_msg if page == 1 and cursor is None else "No tasks on this page."
         return None, None, msg
 
     lines: List[str] = [f"{header} — page {page}", ""]
-    for idx, task in enumerate(tasks, start=offset + 1):
+    for idx, task in enumerate(tasks, start=(page - 1) * limit + 1):
         lines.extend(_format_task_entry(task, idx))
         lines.append("")
 
     text = "\n".join(line for line in lines if line is not None).strip()
-    keyboard = _build_pagination_keyboard("tasks", filter_token, page, len(tasks) == limit)
+    keyboard = _build_pagination_keyboard("tasks", filter_token, page, tasks, has_prev, has_next)
     return text, keyboard, None
 
 
-def _build_idea_list_message(user_id: int, page: int, limit: int = 10):
-    offset = (page - 1) * limit
-    ideas = get_ideas_by_user(user_id, limit=limit, offset=offset)
+async def _build_idea_list_message(
+    user_id: int,
+    page: int,
+    limit: int = 10,
+    cursor: Optional[Tuple[str, int]] = None,
+    backward: bool = False,
+):
+    ideas, page, has_prev, has_next = await _fetch_page(get_ideas_by_user, user_id, page, limit, cursor, backward)
     if not ideas:
-        msg = "No ideas saved yet. Share your spark and I'll keep it." if offset == 0 else "No ideas on this page."
+        msg = "No ideas saved yet. Share your spark and I'll keep it." if page == 1 and cursor is None else "No ideas on this page."
         return None, None, msg
 
     lines: List[str] = [f"💡 Ideas — page {page}", ""]
-    for idx, idea in enumerate(ideas, start=offset + 1):
+    for idx, idea in enumerate(ideas, start=(page - 1) * limit + 1):
         lines.extend(_format_idea_entry(idea, idx))
         lines.append("")
 
     text = "\n".join(line for line in lines if line is not None).strip()
-    keyboard = _build_pagination_keyboard("ideas", "all", page, len(ideas) == limit)
+    keyboard = _build_pagination_keyboard("ideas", "all", page, ideas, has_prev, has_next)
     return text, keyboard, None
 
 
-def _build_note_list_message(user_id: int, page: int, limit: int = 10):
-    offset = (page - 1) * limit
-    notes = get_notes_by_user(user_id, limit=limit, offset=offset)
+async def _build_note_list_message(
+    user_id: int,
+    page: int,
+    limit: int = 10,
+    cursor: Optional[Tuple[str, int]] = None,
+    backward: bool = False,
+):
+    notes, page, has_prev, has_next = await _fetch_page(get_notes_by_user, user_id, page, limit, cursor, backward)
     if not notes:
-        msg = "You do not have notes yet. Send any thought to get started." if offset == 0 else "No notes on this page."
+        msg = "You do not have notes yet. Send any thought to get started." if page == 1 and cursor is None else "No notes on this page."
         return None, None, msg
 
     lines: List[str] = [f"🗒️ Notes — page {page}", ""]
-    for idx, note in enumerate(notes, start=offset + 1):
+    for idx, note in enumerate(notes, start=(page - 1) * limit + 1):
         lines.extend(_format_note_entry(note, idx))
         lines.append("")
 
     text = "\n".join(line for line in lines if line is not None).strip()
-    keyboard = _build_pagination_keyboard("notes", "all", page, len(notes) == limit)
+    keyboard = _build_pagination_keyboard("notes", "all", page, notes, has_prev, has_next)
     return text, keyboard, None
 
 
+async def _fetch_page(fetch_fn, user_id: int, page: int, limit: int, cursor: Optional[Tuple[str, int]], backward: bool):
+    """
+    Loads one page plus a probe row to learn whether another page follows.
+    With a cursor the page is found by (created_at, id) keyset, so flipping
+    pages costs the same at any depth; without one (a page number typed into a
+    command) it falls back to OFFSET.
+    """
+    offset = 0 if cursor else (page - 1) * limit
+    rows = await fetch_fn(user_id, limit=limit + 1, offset=offset, cursor=cursor, backward=backward)
+    if backward:
+        has_prev = len(rows) > limit
+        rows = rows[-limit:]
+        if not has_prev:
+            page = 1
+        return rows, page, has_prev, True
+
+    has_next = len(rows) > limit
+    return rows[:limit], page, page > 1, has_next
+
+
 def _format_task_entry(task: dict, idx: int) -> List[str]:
     title = _escape_markdown(task.get("title") or "Untitled task")
     status = (task.get("status") or "pending").lower()
@@ -848,20 +941,27 @@ def _format_note_entry(note: dict, idx: int) -> List[str]:
     return lines
 
 
-def _build_pagination_keyboard(list_type: str, filter_token: str, page: int, has_next: bool):
+def _build_pagination_keyboard(
+    list_type: str,
+    filter_token: str,
+    page: int,
+    rows: List[dict],
+    has_prev: bool,
+    has_next: bool,
+):
     buttons = []
-    if page > 1:
+    if has_prev:
         buttons.append(
             InlineKeyboardButton(
                 "⬅ Prev",
-                callback_data=f"page:{list_type}:{filter_token}:{page - 1}",
+                callback_data=_page_callback_data(list_type, filter_token, page - 1, rows[0], backward=True),
             )
         )
     if has_next:
         buttons.append(
             InlineKeyboardButton(
                 "Next ➡",
-                callback_data=f"page:{list_type}:{filter_token}:{page + 1}",
+                callback_data=_page_callback_data(list_type, filter_token, page + 1, rows[-1], backward=False),
             )
         )
 
@@ -870,6 +970,53 @@ def _build_pagination_keyboard(list_type: str, filter_token: str, page: int, has
     return InlineKeyboardMarkup([buttons])
 
 
+def _page_callback_data(list_type: str, filter_token: str, page: int, anchor: dict, backward: bool) -> str:
+    # created_at is packed into its 14 digits to stay inside Telegram's 64-byte callback limit.
+    digits = re.sub(r"\D", "", str(anchor.get("created_at") or ""))
+    base = f"page:{list_type}:{filter_token}:{page}"
+    if len(digits) != 14:
+        return base
+    return f"{base}:{'p' if backward else 'n'}{digits}.{anchor['id']}"
+
+
+def _decode_page_cursor(token: str) -> Tuple[Tuple[str, int], bool]:
+    direction, digits, id_part = token[:1], token[1:15], token[16:]
+    if direction not in {"n", "p"} or not digits.isdigit() or len(digits) != 14 or token[15:16] != ".":
+        raise ValueError("Invalid page cursor.")
+    created_at = f"{digits[0:4]}-{digits[4:6]}-{digits[6:8]} {digits[8:10]}:{digits[10:12]}:{digits[12:14]}"
+    return (created_at, int(id_part)), direction == "p"
+
+
+async def _on_startup(application: Application):
+    start_executors()
+    start_db_writer()
+    get_analysis_queue().start()
+    _schedule_metrics_log(application)
+
+
+def _schedule_metrics_log(application: Application):
+    interval = env_float("METRICS_LOG_INTERVAL_SECONDS", 60.0, minimum=0.0)
+    if not interval:
+        return
+    if application.job_queue is None:
+        logger.warning("Periodic metrics logging needs python-telegram-bot[job-queue]; skipping it")
+        return
+    application.job_queue.run_repeating(_log_metrics, interval=interval, first=interval, name="metrics")
+
+
+async def _log_metrics(context: ContextTypes.DEFAULT_TYPE):
+    metrics.log_live()
+
+
+async def _on_shutdown(application: Application):
+    await get_analysis_queue().stop()
+    stop_db_writer()
+    shutdown_executors()
+    await close_clients()
+    close_db_connections()
+    metrics.log_summary()
+
+
 def main():
     token = os.getenv('TELEGRAM_TOKEN')
     
@@ -879,8 +1026,12 @@ def main():
     
     init_db()
     logger.info("Database initialized")
+    pruned = get_cache().prune()
+    if pruned:
+        logger.info("Pruned %s expired classification cache entries", pruned)
+    get_offline_model()
     
-    application = Application.builder().token(token).build()
+    application = Application.builder().token(token).post_init(_on_startup).post_shutdown(_on_shutdown).build()
     
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
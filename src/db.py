@@ -1,6 +1,14 @@
+import logging
+import re
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
-from typing import Iterable, List, Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from migrations import run_migrations
+from settings import env_int, env_str
 
 try:
     from zoneinfo import ZoneInfo  # Python 3.9+
@@ -21,66 +29,181 @@ def _resolve_budapest_tz():
 
 BUDAPEST_TZ = _resolve_budapest_tz()
 
-
-def get_db_connection():
-    conn = sqlite3.connect('messages.db')
-    conn.row_factory = sqlite3.Row
+logger = logging.getLogger(__name__)
+
+_connections_lock = threading.Lock()
+_connections: Dict[int, sqlite3.Connection] = {}
+
+_JOURNAL_MODES = {"WAL", "DELETE", "TRUNCATE", "PERSIST", "MEMORY"}
+_SYNCHRONOUS_MODES = {"OFF", "NORMAL", "FULL", "EXTRA"}
+_TEMP_STORES = {"DEFAULT", "FILE", "MEMORY"}
+_CHECKPOINT_MODES = {"PASSIVE", "FULL", "RESTART", "TRUNCATE"}
+
+
+def get_db_connection() -> sqlite3.Connection:
+    """
+    Returns the calling thread's persistent connection, opening it on first use.
+    Connections run in autocommit mode; writes group their statements with `_transaction`.
+    """
+    thread_id = threading.get_ident()
+    conn = _connections.get(thread_id)
+    if conn is None:
+        conn = sqlite3.connect(
+            env_str("DATABASE_PATH", "messages.db"),
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        conn.row_factory = sqlite3.Row
+        _configure_connection(conn)
+        with _connections_lock:
+            _connections[thread_id] = conn
     return conn
 
 
-def init_db():
+def _storage_pragmas() -> List[str]:
+    """
+    Builds the PRAGMA statements applied to every new connection. WAL lets readers
+    proceed while a write is in progress; synchronous=NORMAL is durable in WAL mode
+    except for the last transactions before a power loss.
+    """
+    journal_mode = _choice("SQLITE_JOURNAL_MODE", "WAL", _JOURNAL_MODES)
+    synchronous = _choice("SQLITE_SYNCHRONOUS", "NORMAL", _SYNCHRONOUS_MODES)
+    temp_store = _choice("SQLITE_TEMP_STORE", "MEMORY", _TEMP_STORES)
+    cache_size_kb = env_int("SQLITE_CACHE_SIZE_KB", 16384, minimum=0)
+    mmap_size = env_int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024, minimum=0)
+    busy_timeout_ms = env_int("SQLITE_BUSY_TIMEOUT_MS", 5000, minimum=0)
+    autocheckpoint_pages = env_int("SQLITE_WAL_AUTOCHECKPOINT", 1000, minimum=0)
+    journal_size_limit = env_int("SQLITE_JOURNAL_SIZE_LIMIT", 64 * 1024 * 1024, minimum=-1)
+
+    return [
+        f"PRAGMA busy_timeout = {busy_timeout_ms}",
+        f"PRAGMA journal_mode = {journal_mode}",
+        f"PRAGMA synchronous = {synchronous}",
+        f"PRAGMA cache_size = -{cache_size_kb}",
+        f"PRAGMA mmap_size = {mmap_size}",
+        f"PRAGMA temp_store = {temp_store}",
+        f"PRAGMA wal_autocheckpoint = {autocheckpoint_pages}",
+        f"PRAGMA journal_size_limit = {journal_size_limit}",
+    ]
+
+
+def _configure_connection(conn: sqlite3.Connection):
+    for statement in _storage_pragmas():
+        conn.execute(statement)
+
+
+def _choice(name: str, default: str, allowed: Iterable[str]) -> str:
+    value = (env_str(name, default) or default).upper()
+    if value not in allowed:
+        logger.warning("Ignoring unsupported %s=%s; using %s", name, value, default)
+        return default
+    return value
+
+
+def checkpoint_wal(mode: str = "PASSIVE") -> Optional[tuple]:
+    """
+    Runs a WAL checkpoint and returns SQLite's (busy, log_pages, checkpointed_pages).
+    SQLite already checkpoints every SQLITE_WAL_AUTOCHECKPOINT pages; TRUNCATE is
+    used on shutdown so the -wal file does not linger at its high-water size.
+    """
+    mode = mode.upper()
+    if mode not in _CHECKPOINT_MODES:
+        raise ValueError(f"Unsupported checkpoint mode: {mode}")
+    row = get_db_connection().execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+    return tuple(row) if row else None
+
+
+def close_db_connections():
+    """Checkpoints the WAL and closes every per-thread connection. Called once on shutdown."""
+    try:
+        checkpoint_wal("TRUNCATE")
+    except sqlite3.Error as exc:
+        logger.warning("WAL checkpoint on shutdown failed: %s", exc)
+
+    with _connections_lock:
+        connections = list(_connections.values())
+        _connections.clear()
+    for conn in connections:
+        try:
+            conn.close()
+        except sqlite3.Error as exc:
+            logger.warning("Failed to close database connection: %s", exc)
+    logger.info("Closed %s database connection(s)", len(connections))
+
+
+_savepoints = threading.local()
+
+
+@contextmanager
+def _transaction() -> Iterator[sqlite3.Cursor]:
+    """
+    Runs the block in a BEGIN IMMEDIATE transaction. Inside an open transaction
+    (a `group_commit` batch) it becomes a SAVEPOINT instead, so an error rolls back
+    only this block's statements and the enclosing transaction carries on.
+    """
     conn = get_db_connection()
     cursor = conn.cursor()
+    if conn.in_transaction:
+        depth = getattr(_savepoints, "depth", 0) + 1
+        name = f"sp_{depth}"
+        _savepoints.depth = depth
+        cursor.execute(f"SAVEPOINT {name}")
+        try:
+            yield cursor
+        except BaseException:
+            cursor.execute(f"ROLLBACK TO {name}")
+            cursor.execute(f"RELEASE {name}")
+            raise
+        else:
+            cursor.execute(f"RELEASE {name}")
+        finally:
+            _savepoints.depth = depth - 1
+        return
 
-    cursor.execute(
-        '''
-        CREATE TABLE IF NOT EXISTS tasks(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            title TEXT NOT NULL,
-            description TEXT,
-            deadline TEXT,
-            tags TEXT,
-            estimated_minutes INTEGER,
-            importance INTEGER,
-            urgency INTEGER,
-            reason TEXT,
-            priority_score REAL,
-            status TEXT DEFAULT 'pending',
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-        '''
-    )
-    _ensure_task_columns(cursor)
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        yield cursor
+        cursor.execute("COMMIT")
+    except BaseException:
+        # A failed COMMIT (SQLITE_BUSY, say) leaves the transaction open; without
+        # the rollback every later write would nest inside it as a savepoint and
+        # silently never be saved. Some errors already rolled it back.
+        if conn.in_transaction:
+            cursor.execute("ROLLBACK")
+        raise
+
+
+def group_commit(calls: Sequence[Callable[[], Any]]) -> List[Tuple[bool, Any]]:
+    """
+    Runs every call in its own savepoint inside one transaction, so the batch costs
+    a single commit. Returns (True, result) or (False, exception) per call; a failed
+    call rolls back only its own writes. If the commit itself fails, it raises and
+    none of the calls took effect.
+    """
+    outcomes: List[Tuple[bool, Any]] = []
+    with _transaction():
+        for call in calls:
+            try:
+                with _transaction():
+                    outcomes.append((True, call()))
+            except Exception as exc:
+                outcomes.append((False, exc))
+    return outcomes
+
+
+def _fetch_all(query: str, params: Union[Sequence[Any], Dict[str, Any]]) -> List[dict]:
+    rows = get_db_connection().execute(query, params).fetchall()
+    return [dict(row) for row in rows]
 
-    cursor.execute(
-        '''
-        CREATE TABLE IF NOT EXISTS ideas(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            title TEXT NOT NULL,
-            description TEXT,
-            tags TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-        '''
-    )
 
-    cursor.execute(
-        '''
-        CREATE TABLE IF NOT EXISTS notes(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            title TEXT,
-            content TEXT NOT NULL,
-            tags TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-        '''
-    )
+def _fetch_one(query: str, params: Sequence[Any]) -> Optional[dict]:
+    row = get_db_connection().execute(query, params).fetchone()
+    return dict(row) if row else None
 
-    conn.commit()
-    conn.close()
+
+def init_db():
+    version = run_migrations(get_db_connection())
+    logger.info("Database schema at version %s", version)
 
 
 def _normalize_tags(tags: Optional[Iterable[str]]) -> Optional[str]:
@@ -105,43 +228,39 @@ def save_task(
     priority_score: Optional[float] = None,
     status: str = "pending",
 ) -> int:
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        '''
-        INSERT INTO tasks (
-            user_id,
-            title,
-            description,
-            deadline,
-            tags,
-            estimated_minutes,
-            importance,
-            urgency,
-            reason,
-            priority_score,
-            status
+    with _transaction() as cursor:
+        cursor.execute(
+            '''
+            INSERT INTO tasks (
+                user_id,
+                title,
+                description,
+                deadline,
+                tags,
+                estimated_minutes,
+                importance,
+                urgency,
+                reason,
+                priority_score,
+                status
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''',
+            (
+                user_id,
+                title,
+                description,
+                deadline,
+                _normalize_tags(tags),
+                estimated_minutes,
+                importance,
+                urgency,
+                reason,
+                priority_score,
+                status,
+            ),
         )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''',
-        (
-            user_id,
-            title,
-            description,
-            deadline,
-            _normalize_tags(tags),
-            estimated_minutes,
-            importance,
-            urgency,
-            reason,
-            priority_score,
-            status,
-        ),
-    )
-    task_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return task_id
+        return cursor.lastrowid
 
 
 def update_task_analysis(
@@ -151,195 +270,207 @@ def update_task_analysis(
     reason: str,
     priority_score: float,
 ):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        '''
-        UPDATE tasks
-        SET importance = ?, urgency = ?, reason = ?, priority_score = ?
-        WHERE id = ?
-        ''',
-        (importance, urgency, reason, priority_score, task_id),
-    )
-    conn.commit()
-    conn.close()
+    with _transaction() as cursor:
+        cursor.execute(
+            '''
+            UPDATE tasks
+            SET importance = ?, urgency = ?, reason = ?, priority_score = ?
+            WHERE id = ?
+            ''',
+            (importance, urgency, reason, priority_score, task_id),
+        )
 
 
-def save_idea(user_id: int, title: str, description: Optional[str], tags: Optional[Iterable[str]]):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        '''
-        INSERT INTO ideas (user_id, title, description, tags)
-        VALUES (?, ?, ?, ?)
-        ''',
-        (user_id, title, description, _normalize_tags(tags)),
-    )
-    conn.commit()
-    conn.close()
+def save_idea(user_id: int, title: str, description: Optional[str], tags: Optional[Iterable[str]]) -> int:
+    with _transaction() as cursor:
+        cursor.execute(
+            '''
+            INSERT INTO ideas (user_id, title, description, tags)
+            VALUES (?, ?, ?, ?)
+            ''',
+            (user_id, title, description, _normalize_tags(tags)),
+        )
+        return cursor.lastrowid
 
 
-def save_note(user_id: int, title: Optional[str], content: str, tags: Optional[Iterable[str]]):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        '''
-        INSERT INTO notes (user_id, title, content, tags)
-        VALUES (?, ?, ?, ?)
-        ''',
-        (user_id, title, content, _normalize_tags(tags)),
-    )
-    conn.commit()
-    conn.close()
+def save_note(user_id: int, title: Optional[str], content: str, tags: Optional[Iterable[str]]) -> int:
+    with _transaction() as cursor:
+        cursor.execute(
+            '''
+            INSERT INTO notes (user_id, title, content, tags)
+            VALUES (?, ?, ?, ?)
+            ''',
+            (user_id, title, content, _normalize_tags(tags)),
+        )
+        return cursor.lastrowid
 
 
-def get_tasks_by_user(user_id: int, limit: int = 20, offset: int = 0):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        '''
+PageCursor = Tuple[str, int]
+
+
+def _keyset(cursor: Optional[PageCursor], backward: bool) -> Tuple[str, str, Tuple[Any, ...]]:
+    """
+    Builds the keyset condition for listings ordered newest first by (created_at, id).
+    `cursor` is the (created_at, id) of the row the page starts after; with `backward`
+    the page ends before it instead. Backward pages are read oldest first, so both
+    directions walk the same index, and the listing reverses them before returning.
+    """
+    if cursor is None:
+        return "", "ASC" if backward else "DESC", ()
+    operator = ">" if backward else "<"
+    return f"AND (created_at, id) {operator} (?, ?)", "ASC" if backward else "DESC", tuple(cursor)
+
+
+def get_tasks_by_user(
+    user_id: int,
+    limit: int = 20,
+    offset: int = 0,
+    cursor: Optional[PageCursor] = None,
+    backward: bool = False,
+):
+    keyset, order, keyset_params = _keyset(cursor, backward)
+    rows = _fetch_all(
+        f'''
         SELECT id, title, description, deadline, tags, estimated_minutes, importance, urgency, reason, priority_score, status, created_at
         FROM tasks
         WHERE user_id = ?
-        ORDER BY created_at DESC
+          {keyset}
+        ORDER BY created_at {order}, id {order}
         LIMIT ? OFFSET ?
         ''',
-        (user_id, limit, offset),
+        (user_id, *keyset_params, limit, offset),
     )
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+    return rows[::-1] if backward else rows
 
 
-def get_ideas_by_user(user_id: int, limit: int = 20, offset: int = 0):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        '''
+def get_ideas_by_user(
+    user_id: int,
+    limit: int = 20,
+    offset: int = 0,
+    cursor: Optional[PageCursor] = None,
+    backward: bool = False,
+):
+    keyset, order, keyset_params = _keyset(cursor, backward)
+    rows = _fetch_all(
+        f'''
         SELECT id, title, description, tags, created_at
         FROM ideas
         WHERE user_id = ?
-        ORDER BY created_at DESC
+          {keyset}
+        ORDER BY created_at {order}, id {order}
         LIMIT ? OFFSET ?
         ''',
-        (user_id, limit, offset),
+        (user_id, *keyset_params, limit, offset),
     )
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+    return rows[::-1] if backward else rows
 
 
-def get_notes_by_user(user_id: int, limit: int = 20, offset: int = 0):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        '''
+def get_notes_by_user(
+    user_id: int,
+    limit: int = 20,
+    offset: int = 0,
+    cursor: Optional[PageCursor] = None,
+    backward: bool = False,
+):
+    keyset, order, keyset_params = _keyset(cursor, backward)
+    rows = _fetch_all(
+        f'''
         SELECT id, title, content, tags, created_at
         FROM notes
         WHERE user_id = ?
-        ORDER BY created_at DESC
+          {keyset}
+        ORDER BY created_at {order}, id {order}
         LIMIT ? OFFSET ?
         ''',
-        (user_id, limit, offset),
+        (user_id, *keyset_params, limit, offset),
     )
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+    return rows[::-1] if backward else rows
 
 
-def get_tasks_uncompleted(user_id: int, limit: int = 20, offset: int = 0):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        '''
+def get_tasks_uncompleted(
+    user_id: int,
+    limit: int = 20,
+    offset: int = 0,
+    cursor: Optional[PageCursor] = None,
+    backward: bool = False,
+):
+    keyset, order, keyset_params = _keyset(cursor, backward)
+    rows = _fetch_all(
+        f'''
         SELECT id, title, description, deadline, tags, estimated_minutes, importance, urgency, reason, priority_score, status, created_at
         FROM tasks
         WHERE user_id = ?
           AND COALESCE(status, 'pending') != 'done'
-        ORDER BY created_at DESC
+          {keyset}
+        ORDER BY created_at {order}, id {order}
         LIMIT ? OFFSET ?
         ''',
-        (user_id, limit, offset),
+        (user_id, *keyset_params, limit, offset),
     )
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+    return rows[::-1] if backward else rows
 
 
-def get_tasks_completed(user_id: int, limit: int = 20, offset: int = 0):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        '''
+def get_tasks_completed(
+    user_id: int,
+    limit: int = 20,
+    offset: int = 0,
+    cursor: Optional[PageCursor] = None,
+    backward: bool = False,
+):
+    keyset, order, keyset_params = _keyset(cursor, backward)
+    rows = _fetch_all(
+        f'''
         SELECT id, title, description, deadline, tags, estimated_minutes, importance, urgency, reason, priority_score, status, created_at
         FROM tasks
         WHERE user_id = ?
-          AND COALESCE(status, 'pending') = 'done'
-        ORDER BY created_at DESC
+          AND status = 'done'
+          {keyset}
+        ORDER BY created_at {order}, id {order}
         LIMIT ? OFFSET ?
         ''',
-        (user_id, limit, offset),
+        (user_id, *keyset_params, limit, offset),
     )
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+    return rows[::-1] if backward else rows
 
 
 def get_all_ideas(user_id: int):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
+    return _fetch_all(
         '''
         SELECT id, title, description, tags, created_at
         FROM ideas
         WHERE user_id = ?
-        ORDER BY created_at DESC
+        ORDER BY created_at DESC, id DESC
         ''',
         (user_id,),
     )
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
 
 
 def get_all_notes(user_id: int):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
+    return _fetch_all(
         '''
         SELECT id, title, content, tags, created_at
         FROM notes
         WHERE user_id = ?
-        ORDER BY created_at DESC
+        ORDER BY created_at DESC, id DESC
         ''',
         (user_id,),
     )
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
 
 
 def get_all_tasks(user_id: int):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
+    return _fetch_all(
         '''
         SELECT id, title, description, deadline, tags, estimated_minutes, importance, urgency, reason, priority_score, status, created_at
         FROM tasks
         WHERE user_id = ?
-        ORDER BY created_at DESC
+        ORDER BY created_at DESC, id DESC
         ''',
         (user_id,),
     )
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
 
 
 def get_tasks_by_priority(user_id: int, limit: int = 5):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
+    return _fetch_all(
         '''
         SELECT id, title, description, deadline, tags, estimated_minutes, importance, urgency, reason, priority_score, status, created_at
         FROM tasks
@@ -350,87 +481,125 @@ def get_tasks_by_priority(user_id: int, limit: int = 5):
         ''',
         (user_id, limit),
     )
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
 
 
 def delete_all_tasks(user_id: int):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM tasks WHERE user_id = ?', (user_id,))
-    conn.commit()
-    conn.close()
+    with _transaction() as cursor:
+        cursor.execute('DELETE FROM tasks WHERE user_id = ?', (user_id,))
 
 
 def delete_tasks_by_ids(user_id: int, task_ids: Iterable[int]):
     ids = list(task_ids)
     if not ids:
         return
-    conn = get_db_connection()
-    cursor = conn.cursor()
     query = f'''
         DELETE FROM tasks
         WHERE user_id = ?
         AND id IN ({','.join(['?'] * len(ids))})
     '''
-    cursor.execute(query, (user_id, *ids))
-    conn.commit()
-    conn.close()
+    with _transaction() as cursor:
+        cursor.execute(query, (user_id, *ids))
 
 
 def delete_all_ideas(user_id: int):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM ideas WHERE user_id = ?', (user_id,))
-    conn.commit()
-    conn.close()
+    with _transaction() as cursor:
+        cursor.execute('DELETE FROM ideas WHERE user_id = ?', (user_id,))
 
 
 def delete_ideas_by_ids(user_id: int, idea_ids: Iterable[int]):
     ids = list(idea_ids)
     if not ids:
         return
-    conn = get_db_connection()
-    cursor = conn.cursor()
     query = f'''
         DELETE FROM ideas
         WHERE user_id = ?
         AND id IN ({','.join(['?'] * len(ids))})
     '''
-    cursor.execute(query, (user_id, *ids))
-    conn.commit()
-    conn.close()
+    with _transaction() as cursor:
+        cursor.execute(query, (user_id, *ids))
 
 
 def delete_all_notes(user_id: int):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM notes WHERE user_id = ?', (user_id,))
-    conn.commit()
-    conn.close()
+    with _transaction() as cursor:
+        cursor.execute('DELETE FROM notes WHERE user_id = ?', (user_id,))
 
 
 def delete_notes_by_ids(user_id: int, note_ids: Iterable[int]):
     ids = list(note_ids)
     if not ids:
         return
-    conn = get_db_connection()
-    cursor = conn.cursor()
     query = f'''
         DELETE FROM notes
         WHERE user_id = ?
         AND id IN ({','.join(['?'] * len(ids))})
     '''
-    cursor.execute(query, (user_id, *ids))
-    conn.commit()
-    conn.close()
+    with _transaction() as cursor:
+        cursor.execute(query, (user_id, *ids))
+
+
+def delete_tasks_by_positions(user_id: int, positions: Iterable[int]):
+    return _delete_by_positions("tasks", user_id, positions)
+
+
+def delete_ideas_by_positions(user_id: int, positions: Iterable[int]):
+    return _delete_by_positions("ideas", user_id, positions)
+
+
+def delete_notes_by_positions(user_id: int, positions: Iterable[int]):
+    return _delete_by_positions("notes", user_id, positions)
+
+
+def _delete_by_positions(table: str, user_id: int, positions: Iterable[int]) -> Optional[Tuple[List[int], List[int]]]:
+    """
+    Deletes rows by their 1-based position in the newest-first listing and returns
+    (deleted_positions, invalid_positions), or None when the user has no rows.
+    Positions are resolved with a window over the listing order, read only up to the
+    highest requested position, and nothing is deleted if any position is invalid.
+    """
+    requested = list(positions)
+    wanted = sorted({position for position in requested if position >= 1})
+
+    with _transaction() as cursor:
+        resolved: Dict[int, int] = {}
+        if wanted:
+            cursor.execute(
+                f'''
+                SELECT position, id FROM (
+                    SELECT id, ROW_NUMBER() OVER (ORDER BY created_at DESC, id DESC) AS position
+                    FROM {table}
+                    WHERE user_id = ?
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT ?
+                )
+                WHERE position IN ({','.join(['?'] * len(wanted))})
+                ''',
+                (user_id, wanted[-1], *wanted),
+            )
+            resolved = {row['position']: row['id'] for row in cursor.fetchall()}
+
+        if not resolved:
+            cursor.execute(f'SELECT 1 FROM {table} WHERE user_id = ? LIMIT 1', (user_id,))
+            if cursor.fetchone() is None:
+                return None
+
+        invalid = [position for position in requested if position not in resolved]
+        if invalid:
+            return [], invalid
+
+        ids = list(resolved.values())
+        cursor.execute(
+            f'''
+            DELETE FROM {table}
+            WHERE user_id = ?
+            AND id IN ({','.join(['?'] * len(ids))})
+            ''',
+            (user_id, *ids),
+        )
+        return requested, []
 
 
 def get_idea_by_id(user_id: int, idea_id: int):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
+    return _fetch_one(
         '''
         SELECT id, title, description, tags, created_at
         FROM ideas
@@ -438,15 +607,10 @@ def get_idea_by_id(user_id: int, idea_id: int):
         ''',
         (idea_id, user_id),
     )
-    row = cursor.fetchone()
-    conn.close()
-    return dict(row) if row else None
 
 
 def get_note_by_id(user_id: int, note_id: int):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
+    return _fetch_one(
         '''
         SELECT id, title, content, tags, created_at
         FROM notes
@@ -454,32 +618,23 @@ def get_note_by_id(user_id: int, note_id: int):
         ''',
         (note_id, user_id),
     )
-    row = cursor.fetchone()
-    conn.close()
-    return dict(row) if row else None
 
 
 def update_task_status(user_id: int, task_id: int, status: str) -> bool:
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        '''
-        UPDATE tasks
-        SET status = ?
-        WHERE id = ? AND user_id = ?
-        ''',
-        (status, task_id, user_id),
-    )
-    conn.commit()
-    updated = cursor.rowcount > 0
-    conn.close()
-    return updated
+    with _transaction() as cursor:
+        cursor.execute(
+            '''
+            UPDATE tasks
+            SET status = ?
+            WHERE id = ? AND user_id = ?
+            ''',
+            (status, task_id, user_id),
+        )
+        return cursor.rowcount > 0
 
 
 def get_task_by_id(user_id: int, task_id: int):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
+    return _fetch_one(
         '''
         SELECT id, title, description, deadline, tags, estimated_minutes, importance, urgency, reason, priority_score, status, created_at
         FROM tasks
@@ -487,48 +642,39 @@ def get_task_by_id(user_id: int, task_id: int):
         ''',
         (task_id, user_id),
     )
-    row = cursor.fetchone()
-    conn.close()
-    return dict(row) if row else None
 
 
 def snooze_task_deadline(user_id: int, task_id: int, days: int = 1) -> Optional[str]:
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        'SELECT deadline FROM tasks WHERE id = ? AND user_id = ?',
-        (task_id, user_id),
-    )
-    row = cursor.fetchone()
-    if not row:
-        conn.close()
-        return None
+    with _transaction() as cursor:
+        cursor.execute(
+            'SELECT deadline FROM tasks WHERE id = ? AND user_id = ?',
+            (task_id, user_id),
+        )
+        row = cursor.fetchone()
+        if not row:
+            return None
 
-    current_deadline = row['deadline']
-    today = _budapest_today()
+        current_deadline = row['deadline']
+        today = _budapest_today()
 
-    try:
-        base_date = datetime.fromisoformat(current_deadline).date() if current_deadline else today
-    except ValueError:
-        base_date = today
+        try:
+            base_date = datetime.fromisoformat(current_deadline).date() if current_deadline else today
+        except ValueError:
+            base_date = today
 
-    new_date = base_date + timedelta(days=days)
-    new_deadline = new_date.isoformat()
+        new_date = base_date + timedelta(days=days)
+        new_deadline = new_date.isoformat()
 
-    cursor.execute(
-        'UPDATE tasks SET deadline = ? WHERE id = ? AND user_id = ?',
-        (new_deadline, task_id, user_id),
-    )
-    conn.commit()
-    conn.close()
-    return new_deadline
+        cursor.execute(
+            'UPDATE tasks SET deadline = ? WHERE id = ? AND user_id = ?',
+            (new_deadline, task_id, user_id),
+        )
+        return new_deadline
 
 
 def get_tasks_due_today_or_high_priority(user_id: int, limit: int = 5, priority_threshold: float = 4.0):
     today = _budapest_today().isoformat()
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
+    return _fetch_all(
         '''
         SELECT id, title, description, deadline, tags, estimated_minutes, importance, urgency, reason, priority_score, status, created_at
         FROM tasks
@@ -543,100 +689,295 @@ def get_tasks_due_today_or_high_priority(user_id: int, limit: int = 5, priority_
         ''',
         (user_id, today, priority_threshold, limit),
     )
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+
+
+# Snippet highlight markers. Control characters never occur in user text, so
+# callers can escape the snippet for their markup and then swap these in.
+SNIPPET_START = "\x02"
+SNIPPET_END = "\x03"
+
+_SEARCH_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _fts_query(query: str) -> Optional[str]:
+    """
+    Turns free text into an FTS5 query matching every word as a prefix, so
+    "groc tom" finds "Buy groceries tomorrow". Returns None when nothing is searchable.
+    """
+    tokens = _SEARCH_TOKEN_RE.findall(query or "")
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
 
 
 def search_tasks(user_id: int, query: str, limit: int = 10):
-    wildcard = f'%{query}%'
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        '''
-        SELECT id, title, description, deadline, tags, importance, urgency, status
-        FROM tasks
-        WHERE user_id = ?
-          AND (
-                title LIKE ?
-                OR description LIKE ?
-                OR tags LIKE ?
-              )
-        ORDER BY created_at DESC
+    match = _fts_query(query)
+    if not match:
+        return []
+    return _fetch_all(
+        f'''
+        SELECT t.id, t.title, t.description, t.deadline, t.tags, t.importance, t.urgency, t.status,
+               snippet(tasks_fts, -1, '{SNIPPET_START}', '{SNIPPET_END}', '…', 12) AS snippet
+        FROM tasks_fts
+        JOIN tasks t ON t.id = tasks_fts.rowid
+        WHERE tasks_fts MATCH ?
+          AND t.user_id = ?
+        ORDER BY bm25(tasks_fts, 10.0, 4.0, 6.0)
         LIMIT ?
         ''',
-        (user_id, wildcard, wildcard, wildcard, limit),
+        (match, user_id, limit),
     )
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
 
 
 def search_ideas(user_id: int, query: str, limit: int = 10):
-    wildcard = f'%{query}%'
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        '''
-        SELECT id, title, description, tags
-        FROM ideas
-        WHERE user_id = ?
-          AND (
-                title LIKE ?
-                OR description LIKE ?
-                OR tags LIKE ?
-              )
-        ORDER BY created_at DESC
+    match = _fts_query(query)
+    if not match:
+        return []
+    return _fetch_all(
+        f'''
+        SELECT i.id, i.title, i.description, i.tags,
+               snippet(ideas_fts, -1, '{SNIPPET_START}', '{SNIPPET_END}', '…', 12) AS snippet
+        FROM ideas_fts
+        JOIN ideas i ON i.id = ideas_fts.rowid
+        WHERE ideas_fts MATCH ?
+          AND i.user_id = ?
+        ORDER BY bm25(ideas_fts, 10.0, 4.0, 6.0)
         LIMIT ?
         ''',
-        (user_id, wildcard, wildcard, wildcard, limit),
+        (match, user_id, limit),
     )
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
 
 
 def search_notes(user_id: int, query: str, limit: int = 10):
-    wildcard = f'%{query}%'
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        '''
-        SELECT id, title, content, tags
-        FROM notes
-        WHERE user_id = ?
-          AND (
-                title LIKE ?
-                OR content LIKE ?
-                OR tags LIKE ?
-              )
-        ORDER BY created_at DESC
+    match = _fts_query(query)
+    if not match:
+        return []
+    return _fetch_all(
+        f'''
+        SELECT n.id, n.title, n.content, n.tags,
+               snippet(notes_fts, -1, '{SNIPPET_START}', '{SNIPPET_END}', '…', 12) AS snippet
+        FROM notes_fts
+        JOIN notes n ON n.id = notes_fts.rowid
+        WHERE notes_fts MATCH ?
+          AND n.user_id = ?
+        ORDER BY bm25(notes_fts, 10.0, 4.0, 6.0)
         LIMIT ?
         ''',
-        (user_id, wildcard, wildcard, wildcard, limit),
+        (match, user_id, limit),
     )
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
 
 
-def _ensure_task_columns(cursor):
-    expected_columns = {
-        "importance": "ALTER TABLE tasks ADD COLUMN importance INTEGER",
-        "urgency": "ALTER TABLE tasks ADD COLUMN urgency INTEGER",
-        "reason": "ALTER TABLE tasks ADD COLUMN reason TEXT",
-        "priority_score": "ALTER TABLE tasks ADD COLUMN priority_score REAL",
-        "status": "ALTER TABLE tasks ADD COLUMN status TEXT DEFAULT 'pending'"
-    }
+def search_all(user_id: int, query: str, per_type_limit: int = 5, limit: int = 15):
+    """
+    Searches tasks, ideas and notes in one statement and returns typed hits
+    (`type`, `id`, `title`, `snippet`, `rank`) ordered by BM25 rank, best first.
+    Each type contributes at most `per_type_limit` hits and at most `limit` are returned.
+    """
+    match = _fts_query(query)
+    if not match:
+        return []
+    return _fetch_all(
+        f'''
+        SELECT * FROM (
+            SELECT 'task' AS type, t.id, t.title,
+                   snippet(tasks_fts, -1, '{SNIPPET_START}', '{SNIPPET_END}', '…', 12) AS snippet,
+                   bm25(tasks_fts, 10.0, 4.0, 6.0) AS rank
+            FROM tasks_fts
+            JOIN tasks t ON t.id = tasks_fts.rowid
+            WHERE tasks_fts MATCH :match AND t.user_id = :user_id
+            ORDER BY rank
+            LIMIT :per_type_limit
+        )
+        UNION ALL
+        SELECT * FROM (
+            SELECT 'idea' AS type, i.id, i.title,
+                   snippet(ideas_fts, -1, '{SNIPPET_START}', '{SNIPPET_END}', '…', 12) AS snippet,
+                   bm25(ideas_fts, 10.0, 4.0, 6.0) AS rank
+            FROM ideas_fts
+            JOIN ideas i ON i.id = ideas_fts.rowid
+            WHERE ideas_fts MATCH :match AND i.user_id = :user_id
+            ORDER BY rank
+            LIMIT :per_type_limit
+        )
+        UNION ALL
+        SELECT * FROM (
+            SELECT 'note' AS type, n.id, n.title,
+                   snippet(notes_fts, -1, '{SNIPPET_START}', '{SNIPPET_END}', '…', 12) AS snippet,
+                   bm25(notes_fts, 10.0, 4.0, 6.0) AS rank
+            FROM notes_fts
+            JOIN notes n ON n.id = notes_fts.rowid
+            WHERE notes_fts MATCH :match AND n.user_id = :user_id
+            ORDER BY rank
+            LIMIT :per_type_limit
+        )
+        ORDER BY rank
+        LIMIT :limit
+        ''',
+        {"match": match, "user_id": user_id, "per_type_limit": per_type_limit, "limit": limit},
+    )
+
+
+def get_cached_classification(key: str, min_created_at: float) -> Optional[Tuple[float, str]]:
+    row = _fetch_one(
+        'SELECT created_at, payload FROM classification_cache WHERE key = ? AND created_at >= ?',
+        (key, min_created_at),
+    )
+    return (row['created_at'], row['payload']) if row else None
+
+
+def put_cached_classification(key: str, payload: str, created_at: float):
+    with _transaction() as cursor:
+        cursor.execute(
+            'INSERT OR REPLACE INTO classification_cache (key, payload, created_at) VALUES (?, ?, ?)',
+            (key, payload, created_at),
+        )
 
-    cursor.execute("PRAGMA table_info(tasks)")
-    existing = {row[1] for row in cursor.fetchall()}
 
-    for column, statement in expected_columns.items():
-        if column not in existing:
-            cursor.execute(statement)
+def prune_classification_cache(older_than: float) -> int:
+    with _transaction() as cursor:
+        cursor.execute('DELETE FROM classification_cache WHERE created_at < ?', (older_than,))
+        return cursor.rowcount
+
+
+def get_training_samples(limit_per_type: int = 5000) -> List[Tuple[str, str]]:
+    """Most recent (type, text) pairs across tasks, ideas and notes for the offline classifier."""
+    rows = _fetch_all(
+        '''
+        SELECT * FROM (
+            SELECT 'task' AS type, title, description AS body FROM tasks ORDER BY id DESC LIMIT :limit
+        )
+        UNION ALL
+        SELECT * FROM (
+            SELECT 'idea' AS type, title, description AS body FROM ideas ORDER BY id DESC LIMIT :limit
+        )
+        UNION ALL
+        SELECT * FROM (
+            SELECT 'note' AS type, title, content AS body FROM notes ORDER BY id DESC LIMIT :limit
+        )
+        ''',
+        {"limit": limit_per_type},
+    )
+    return [(row['type'], " ".join(part for part in (row['title'], row['body']) if part)) for row in rows]
+
+
+def enqueue_analysis_job(task_id: int, details: Optional[str]):
+    now = time.time()
+    with _transaction() as cursor:
+        cursor.execute(
+            '''
+            INSERT OR IGNORE INTO analysis_jobs (task_id, details, status, attempts, available_at, created_at)
+            VALUES (?, ?, 'pending', 0, ?, ?)
+            ''',
+            (task_id, details, now, now),
+        )
+
+
+def save_task_with_job(
+    user_id: int,
+    title: str,
+    description: Optional[str],
+    deadline: Optional[str],
+    tags: Optional[Iterable[str]],
+    estimated_minutes: Optional[int],
+    details: Optional[str],
+) -> int:
+    """Saves an unscored task and its analysis job atomically; returns the task id."""
+    with _transaction():
+        task_id = save_task(user_id, title, description, deadline, tags, estimated_minutes)
+        enqueue_analysis_job(task_id, details)
+        return task_id
+
+
+def lease_analysis_job(lease_seconds: float) -> Optional[dict]:
+    """
+    Claims the oldest runnable job (pending, or leased with an expired lease) and
+    returns it joined with its task; None when nothing is due. Jobs whose task was
+    deleted are dropped on the way.
+    """
+    now = time.time()
+    with _transaction() as cursor:
+        while True:
+            cursor.execute(
+                '''
+                SELECT j.id, j.task_id, j.details, j.attempts, t.id AS found, t.title, t.description, t.deadline
+                FROM analysis_jobs j
+                LEFT JOIN tasks t ON t.id = j.task_id
+                WHERE j.status IN ('pending', 'leased') AND j.available_at <= ?
+                ORDER BY j.available_at
+                LIMIT 1
+                ''',
+                (now,),
+            )
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            if row['found'] is None:
+                cursor.execute('DELETE FROM analysis_jobs WHERE id = ?', (row['id'],))
+                continue
+            cursor.execute(
+                "UPDATE analysis_jobs SET status = 'leased', attempts = attempts + 1, available_at = ? WHERE id = ?",
+                (now + lease_seconds, row['id']),
+            )
+            job = dict(row)
+            job['attempts'] += 1
+            del job['found']
+            return job
+
+
+def renew_analysis_lease(job_id: int, lease_seconds: float) -> bool:
+    """Pushes a running job's lease expiry out, so no other worker picks it up meanwhile."""
+    with _transaction() as cursor:
+        cursor.execute(
+            "UPDATE analysis_jobs SET available_at = ? WHERE id = ? AND status = 'leased'",
+            (time.time() + lease_seconds, job_id),
+        )
+        return cursor.rowcount > 0
+
+
+def finish_analysis_job(job_id: int):
+    with _transaction() as cursor:
+        cursor.execute('DELETE FROM analysis_jobs WHERE id = ?', (job_id,))
+
+
+def retry_analysis_job(job_id: int, delay_seconds: float, error: str):
+    with _transaction() as cursor:
+        cursor.execute(
+            "UPDATE analysis_jobs SET status = 'pending', available_at = ?, last_error = ? WHERE id = ?",
+            (time.time() + delay_seconds, error, job_id),
+        )
+
+
+def fail_analysis_job(job_id: int, error: str):
+    with _transaction() as cursor:
+        cursor.execute(
+            "UPDATE analysis_jobs SET status = 'failed', last_error = ? WHERE id = ?",
+            (error, job_id),
+        )
+
+
+def recover_analysis_jobs() -> Tuple[int, int]:
+    """
+    Startup recovery: releases leases held by a previous process and enqueues a job
+    for every task that still has no priority score. Returns (released, enqueued).
+    """
+    now = time.time()
+    with _transaction() as cursor:
+        cursor.execute(
+            "UPDATE analysis_jobs SET status = 'pending', available_at = ? WHERE status = 'leased'",
+            (now,),
+        )
+        released = cursor.rowcount
+        cursor.execute(
+            '''
+            INSERT OR IGNORE INTO analysis_jobs (task_id, details, status, attempts, available_at, created_at)
+            SELECT id, COALESCE(description, title), 'pending', 0, ?, ?
+            FROM tasks
+            WHERE priority_score IS NULL
+            ''',
+            (now, now),
+        )
+        return released, cursor.rowcount
 
 
 def _budapest_today():
     return datetime.now(BUDAPEST_TZ).date()
-
@@ -0,0 +1,146 @@
+"""
+Group-commit writer: the single thread that performs every SQLite write.
+
+Callers hand it a write function and get a future back. The thread takes the
+first pending write, keeps collecting for up to DB_WRITE_FLUSH_MS or until
+DB_WRITE_BATCH_MAX writes are waiting, and runs the whole batch through
+`db.group_commit`: one transaction, one savepoint per write, one commit (and one
+fsync) for all of them. Each future is resolved with its own function's return
+value, such as the new row id from `save_task`, or with its own exception; one
+failing write does not fail its neighbours. Writes from different users arriving
+together at peak time therefore share a commit.
+
+At most DB_WRITE_QUEUE writes may wait; beyond that `submit` raises
+ExecutorSaturatedError, like the bounded executors.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Tuple
+
+import metrics
+from db import group_commit
+from executors import ExecutorSaturatedError
+from settings import env_float, env_int
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+Write = Tuple[Callable[[], Any], Future]
+
+
+class GroupCommitWriter:
+    def __init__(self, flush_seconds: float, max_batch: int, max_queue: int):
+        self.flush_seconds = flush_seconds
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._loop, name="db-writer", daemon=True)
+
+        metrics.define_gauge("db_writer.queued", self._queue.qsize)
+        metrics.define_rate("db_writer.writes_per_commit", "db_writer.writes", "db_writer.commits")
+
+    def start(self):
+        self._thread.start()
+
+    def submit(self, call: Callable[[], Any]) -> Future:
+        """Queues `call` for the next batch and returns a future for its result."""
+        future: Future = Future()
+        try:
+            self._queue.put_nowait((call, future))
+        except queue.Full:
+            metrics.increment("db_writer.rejected")
+            raise ExecutorSaturatedError(f"db writer queue is full ({self.max_queue} waiting)") from None
+        return future
+
+    def stop(self):
+        """Commits everything already queued, then stops the thread."""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _loop(self):
+        while True:
+            batch, stopping = self._collect()
+            if batch:
+                self._commit(batch)
+            if stopping:
+                return
+
+    def _collect(self) -> Tuple[List[Write], bool]:
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _commit(self, batch: List[Write]):
+        # Callers that gave up while waiting are dropped before the transaction starts.
+        live = [(call, future) for call, future in batch if future.set_running_or_notify_cancel()]
+        if not live:
+            return
+        try:
+            outcomes = group_commit([call for call, _ in live])
+        except Exception as exc:
+            logger.error("Group commit of %s write(s) failed: %s", len(live), exc)
+            metrics.increment("db_writer.failed_commits")
+            for _, future in live:
+                future.set_exception(exc)
+            return
+
+        metrics.increment("db_writer.commits")
+        metrics.increment("db_writer.writes", len(live))
+        for (_, future), (ok, value) in zip(live, outcomes):
+            if ok:
+                future.set_result(value)
+            else:
+                metrics.increment("db_writer.failed_writes")
+                future.set_exception(value)
+
+
+_writer: Optional[GroupCommitWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_db_writer() -> GroupCommitWriter:
+    """Returns the running writer, starting it on first use."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                writer = GroupCommitWriter(
+                    flush_seconds=env_float("DB_WRITE_FLUSH_MS", 5.0, minimum=0.0) / 1000,
+                    max_batch=env_int("DB_WRITE_BATCH_MAX", 64, minimum=1),
+                    max_queue=env_int("DB_WRITE_QUEUE", 1024, minimum=1),
+                )
+                writer.start()
+                logger.info(
+                    "DB writer: flush %.1f ms, up to %s write(s) per commit",
+                    writer.flush_seconds * 1000, writer.max_batch,
+                )
+                _writer = writer
+    return _writer
+
+
+def start_db_writer():
+    get_db_writer()
+
+
+def stop_db_writer():
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.stop()
@@ -0,0 +1,131 @@
+"""
+Named, bounded thread pools for blocking work called from the event loop.
+
+`llm` runs blocking OpenAI calls and `db_reader` runs SQLite reads, so a burst
+of slow model requests cannot starve database work (or the reverse) the way it
+could on the loop's shared default executor. (Writes go through the group-commit
+thread in `db_writer`.) Each pool has a fixed number of threads
+(`<NAME>_EXECUTOR_WORKERS`) and a cap on calls waiting for a thread
+(`<NAME>_EXECUTOR_QUEUE`); once that cap is reached `run` fails fast with
+ExecutorSaturatedError instead of queueing without bound. Active and queued
+counts, utilization and peak queue depth are exported as metrics gauges.
+"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, TypeVar
+
+import metrics
+from settings import env_int
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# name -> (default workers, default queue depth)
+_DEFAULT_SIZES = {
+    "llm": (8, 64),
+    "db_reader": (4, 256),
+}
+
+
+class ExecutorSaturatedError(RuntimeError):
+    """Raised when a pool's queue is full."""
+
+
+class BoundedExecutor:
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-executor")
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queued = 0
+        self._peak_queued = 0
+
+        metrics.define_gauge(f"executor.{name}.active", lambda: self._active)
+        metrics.define_gauge(f"executor.{name}.queued", lambda: self._queued)
+        metrics.define_gauge(f"executor.{name}.peak_queued", lambda: self._peak_queued)
+        metrics.define_gauge(f"executor.{name}.utilization", lambda: self._active / self.max_workers)
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """Runs `fn(*args)` on this pool and awaits the result."""
+        with self._lock:
+            if self._active + self._queued >= self.max_workers + self.max_queue:
+                metrics.increment(f"executor.{self.name}.rejected")
+                raise ExecutorSaturatedError(f"{self.name} executor queue is full ({self.max_queue} waiting)")
+            self._queued += 1
+            self._peak_queued = max(self._peak_queued, self._queued)
+        metrics.increment(f"executor.{self.name}.submitted")
+
+        # Whichever happens first, the call starting or the await being abandoned,
+        # releases the queue slot.
+        slot = {"released": False}
+
+        def release_slot():
+            if not slot["released"]:
+                slot["released"] = True
+                self._queued -= 1
+
+        def call() -> T:
+            with self._lock:
+                release_slot()
+                self._active += 1
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._active -= 1
+                metrics.increment(f"executor.{self.name}.completed")
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, call)
+        except BaseException:
+            with self._lock:
+                release_slot()
+            raise
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+
+_executors: Dict[str, BoundedExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(name: str) -> BoundedExecutor:
+    """Returns the named pool, creating it from `<NAME>_EXECUTOR_WORKERS` / `_QUEUE` on first use."""
+    executor = _executors.get(name)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                workers, queue = _DEFAULT_SIZES[name]
+                prefix = name.upper()
+                executor = BoundedExecutor(
+                    name,
+                    max_workers=env_int(f"{prefix}_EXECUTOR_WORKERS", workers, minimum=1),
+                    max_queue=env_int(f"{prefix}_EXECUTOR_QUEUE", queue, minimum=0),
+                )
+                _executors[name] = executor
+    return executor
+
+
+def start_executors():
+    for name in _DEFAULT_SIZES:
+        executor = get_executor(name)
+        logger.info(
+            "Executor %s: %s worker(s), queue limit %s",
+            name, executor.max_workers, executor.max_queue,
+        )
+
+
+def shutdown_executors():
+    """Waits for running calls, drops queued ones and forgets the pools."""
+    with _executors_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown()
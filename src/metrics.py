@@ -0,0 +1,75 @@
+"""
+In-process counters for cache hit rates, fallbacks and similar signals.
+Names are dotted strings such as `classifier.cache.miss`.
+"""
+import logging
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_counters: Dict[str, int] = defaultdict(int)
+_rates: Dict[str, Tuple[str, str]] = {}
+_gauges: Dict[str, Callable[[], float]] = {}
+
+
+def increment(name: str, amount: int = 1):
+    with _lock:
+        _counters[name] += amount
+
+
+def get(name: str) -> int:
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def ratio(numerator: str, denominator: str) -> Optional[float]:
+    with _lock:
+        total = _counters.get(denominator, 0)
+        return _counters.get(numerator, 0) / total if total else None
+
+
+def define_rate(name: str, numerator: str, denominator: str):
+    """Registers a derived ratio that `log_summary` reports next to the counters."""
+    with _lock:
+        _rates[name] = (numerator, denominator)
+
+
+def rates() -> Dict[str, Optional[float]]:
+    with _lock:
+        defined = dict(_rates)
+    return {name: ratio(numerator, denominator) for name, (numerator, denominator) in defined.items()}
+
+
+def define_gauge(name: str, read: Callable[[], float]):
+    """Registers a point-in-time value (a pool's queue depth, say) read on demand."""
+    with _lock:
+        _gauges[name] = read
+
+
+def gauges() -> Dict[str, float]:
+    with _lock:
+        defined = dict(_gauges)
+    return {name: read() for name, read in defined.items()}
+
+
+def snapshot() -> Dict[str, int]:
+    with _lock:
+        return dict(_counters)
+
+
+def log_summary():
+    for name, value in sorted(snapshot().items()):
+        logger.info("metric %s = %s", name, value)
+    log_live()
+
+
+def log_live():
+    """Logs the rates and gauges; run periodically so pool saturation is visible while running."""
+    for name, value in sorted(rates().items()):
+        if value is not None:
+            logger.info("metric %s = %.3f", name, value)
+    for name, value in sorted(gauges().items()):
+        logger.info("metric %s = %s", name, value)
@@ -0,0 +1,333 @@
+"""
+Versioned schema migrations keyed on SQLite's `PRAGMA user_version`.
+
+Each migration is a list of steps and every step runs in its own short
+`BEGIN IMMEDIATE` transaction, so a migration over a large database never holds
+the write lock for longer than one step. A step may return True to ask to be run
+again; long backfills use that to work in batches and let handlers write in
+between. Steps must be idempotent: if the process dies mid-migration the whole
+migration is replayed on the next start, and `user_version` is only bumped once
+every step has finished.
+"""
+import logging
+import sqlite3
+from typing import Callable, List, NamedTuple, Optional, Sequence
+
+from settings import env_int
+
+logger = logging.getLogger(__name__)
+
+Step = Callable[[sqlite3.Cursor], Optional[bool]]
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    steps: List[Step]
+
+
+def run_migrations(conn: sqlite3.Connection) -> int:
+    """
+    Brings the schema up to the latest version and returns it. When the database
+    is already current this is a single PRAGMA read.
+    """
+    current = _user_version(conn)
+    latest = MIGRATIONS[-1].version
+    if current >= latest:
+        return current
+
+    for migration in MIGRATIONS:
+        if migration.version <= current:
+            continue
+        logger.info("Applying schema migration %s: %s", migration.version, migration.description)
+        for step in migration.steps:
+            _run_step(conn, step)
+        _run_step(conn, _execute(f"PRAGMA user_version = {migration.version}"))
+        current = migration.version
+
+    return current
+
+
+def _user_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _run_step(conn: sqlite3.Connection, step: Step):
+    while True:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            more = step(cursor)
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+        cursor.execute("COMMIT")
+        if not more:
+            return
+
+
+def _execute(statement: str) -> Step:
+    def step(cursor: sqlite3.Cursor):
+        cursor.execute(statement)
+
+    return step
+
+
+def _add_missing_task_columns(cursor: sqlite3.Cursor):
+    # Databases created before versioning may predate the analysis columns.
+    expected_columns = {
+        "importance": "ALTER TABLE tasks ADD COLUMN importance INTEGER",
+        "urgency": "ALTER TABLE tasks ADD COLUMN urgency INTEGER",
+        "reason": "ALTER TABLE tasks ADD COLUMN reason TEXT",
+        "priority_score": "ALTER TABLE tasks ADD COLUMN priority_score REAL",
+        "status": "ALTER TABLE tasks ADD COLUMN status TEXT DEFAULT 'pending'"
+    }
+
+    cursor.execute("PRAGMA table_info(tasks)")
+    existing = {row[1] for row in cursor.fetchall()}
+
+    for column, statement in expected_columns.items():
+        if column not in existing:
+            cursor.execute(statement)
+
+
+def _fts_steps(table: str, columns: Sequence[str]) -> List[Step]:
+    """
+    Builds the steps that add an external-content FTS5 index over `table`.
+
+    The sync triggers are installed first, together with a high-water mark of the
+    rows that already exist. Those rows are then copied into the index in batches
+    while new rows are indexed by the triggers. Until the backfill has passed a row,
+    the triggers leave it alone, so no row is ever indexed twice. Once the backfill
+    finishes the triggers are recreated without that guard.
+    """
+    fts = f"{table}_fts"
+    column_list = ", ".join(columns)
+    new_values = ", ".join(f"new.{column}" for column in columns)
+    old_values = ", ".join(f"old.{column}" for column in columns)
+    pending = (
+        f"EXISTS (SELECT 1 FROM fts_backfill WHERE name = '{table}' "
+        f"AND old.id > last_id AND old.id <= max_id)"
+    )
+
+    def create_triggers(cursor: sqlite3.Cursor, guard: str):
+        when = f"WHEN NOT {guard}" if guard else ""
+        cursor.execute(
+            f'''
+            CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values});
+            END
+            '''
+        )
+        cursor.execute(
+            f'''
+            CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} {when} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            END
+            '''
+        )
+        cursor.execute(
+            f'''
+            CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {column_list} ON {table} {when} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+                INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {new_values});
+            END
+            '''
+        )
+
+    def prepare(cursor: sqlite3.Cursor):
+        if cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (fts,)).fetchone():
+            return
+        cursor.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS fts_backfill(
+                name TEXT PRIMARY KEY,
+                last_id INTEGER NOT NULL,
+                max_id INTEGER NOT NULL
+            )
+            '''
+        )
+        cursor.execute(
+            f'''
+            CREATE VIRTUAL TABLE {fts} USING fts5(
+                {column_list},
+                content='{table}',
+                content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='2 3'
+            )
+            '''
+        )
+        cursor.execute(
+            f"INSERT INTO fts_backfill(name, last_id, max_id) SELECT ?, 0, COALESCE(MAX(id), 0) FROM {table}",
+            (table,),
+        )
+        create_triggers(cursor, pending)
+
+    def backfill(cursor: sqlite3.Cursor) -> bool:
+        # Gone when a replay follows a crash between the final DROP and the version bump.
+        if not cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'fts_backfill'").fetchone():
+            return False
+        row = cursor.execute("SELECT last_id, max_id FROM fts_backfill WHERE name = ?", (table,)).fetchone()
+        if row is None or row[0] >= row[1]:
+            return False
+        last_id, max_id = row
+        batch_size = env_int("MIGRATION_BATCH_SIZE", 2000, minimum=1)
+        batch_end = cursor.execute(
+            f"SELECT MAX(id) FROM (SELECT id FROM {table} WHERE id > ? AND id <= ? ORDER BY id LIMIT ?)",
+            (last_id, max_id, batch_size),
+        ).fetchone()[0]
+        batch_end = max_id if batch_end is None else batch_end
+        cursor.execute(
+            f'''
+            INSERT INTO {fts}(rowid, {column_list})
+            SELECT id, {column_list} FROM {table}
+            WHERE id > ? AND id <= ?
+            ''',
+            (last_id, batch_end),
+        )
+        cursor.execute("UPDATE fts_backfill SET last_id = ? WHERE name = ?", (batch_end, table))
+        return batch_end < max_id
+
+    def finish(cursor: sqlite3.Cursor):
+        if not cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'fts_backfill'").fetchone():
+            return
+        for suffix in ("ai", "ad", "au"):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {fts}_{suffix}")
+        create_triggers(cursor, "")
+        cursor.execute("DELETE FROM fts_backfill WHERE name = ?", (table,))
+
+    return [prepare, backfill, finish]
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(
+        1,
+        "base tables",
+        [
+            _execute(
+                '''
+                CREATE TABLE IF NOT EXISTS tasks(
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    title TEXT NOT NULL,
+                    description TEXT,
+                    deadline TEXT,
+                    tags TEXT,
+                    estimated_minutes INTEGER,
+                    importance INTEGER,
+                    urgency INTEGER,
+                    reason TEXT,
+                    priority_score REAL,
+                    status TEXT DEFAULT 'pending',
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+                '''
+            ),
+            _add_missing_task_columns,
+            _execute(
+                '''
+                CREATE TABLE IF NOT EXISTS ideas(
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    title TEXT NOT NULL,
+                    description TEXT,
+                    tags TEXT,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+                '''
+            ),
+            _execute(
+                '''
+                CREATE TABLE IF NOT EXISTS notes(
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    title TEXT,
+                    content TEXT NOT NULL,
+                    tags TEXT,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+                '''
+            ),
+        ],
+    ),
+    # One index per query shape in db.py. The partial indexes repeat the exact
+    # `COALESCE(status, 'pending') != 'done'` term used by the open-task queries so
+    # the planner can prove they apply; the priority index stores the same
+    # `COALESCE(priority_score, 0)` expression the queries sort by.
+    Migration(
+        2,
+        "listing indexes",
+        [
+            _execute("CREATE INDEX IF NOT EXISTS idx_tasks_user_created ON tasks(user_id, created_at)"),
+            _execute("CREATE INDEX IF NOT EXISTS idx_tasks_user_status_created ON tasks(user_id, status, created_at)"),
+            _execute(
+                '''
+                CREATE INDEX IF NOT EXISTS idx_tasks_open_created
+                ON tasks(user_id, created_at)
+                WHERE COALESCE(status, 'pending') != 'done'
+                '''
+            ),
+            _execute(
+                '''
+                CREATE INDEX IF NOT EXISTS idx_tasks_open_priority
+                ON tasks(user_id, COALESCE(priority_score, 0), created_at)
+                WHERE COALESCE(status, 'pending') != 'done'
+                '''
+            ),
+            _execute("CREATE INDEX IF NOT EXISTS idx_ideas_user_created ON ideas(user_id, created_at)"),
+            _execute("CREATE INDEX IF NOT EXISTS idx_notes_user_created ON notes(user_id, created_at)"),
+        ],
+    ),
+    Migration(
+        3,
+        "full-text search",
+        [
+            *_fts_steps("tasks", ("title", "description", "tags")),
+            *_fts_steps("ideas", ("title", "description", "tags")),
+            *_fts_steps("notes", ("title", "content", "tags")),
+            _execute("DROP TABLE IF EXISTS fts_backfill"),
+        ],
+    ),
+    Migration(
+        4,
+        "classification cache",
+        [
+            _execute(
+                '''
+                CREATE TABLE IF NOT EXISTS classification_cache(
+                    key TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                ) WITHOUT ROWID
+                '''
+            ),
+            _execute("CREATE INDEX IF NOT EXISTS idx_classification_cache_created ON classification_cache(created_at)"),
+        ],
+    ),
+    # One row per task waiting for (or being given) its importance/urgency scores.
+    # For a leased job `available_at` is the lease expiry, so pending and expired
+    # leases are claimed by the same index range. Finished jobs are deleted;
+    # `failed` rows are kept for inspection.
+    Migration(
+        5,
+        "analysis jobs",
+        [
+            _execute(
+                '''
+                CREATE TABLE IF NOT EXISTS analysis_jobs(
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    task_id INTEGER NOT NULL UNIQUE,
+                    details TEXT,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    available_at REAL NOT NULL,
+                    last_error TEXT,
+                    created_at REAL NOT NULL
+                )
+                '''
+            ),
+            _execute("CREATE INDEX IF NOT EXISTS idx_analysis_jobs_status_available ON analysis_jobs(status, available_at)"),
+        ],
+    ),
+]
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The bot runs with src/ as its working directory and imports its modules by bare name.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
@@ -0,0 +1,30 @@
+"""Local deadline parsing, against a fixed Monday."""
+from datetime import date
+
+import pytest
+
+from ai.dates import resolve_deadline
+
+MONDAY = date(2026, 10, 19)
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("call bob tomorrow", "2026-10-20"),
+        ("day after tomorrow", "2026-10-21"),
+        ("pay rent 2026-10-23", "2026-10-23"),
+        ("by Friday", "2026-10-23"),
+        ("next monday", "2026-10-26"),
+        ("next week", "2026-10-26"),
+        ("in two weeks", "2026-11-02"),
+        ("finish report by Friday next week", "2026-10-30"),
+        ("submit taxes next week on Tuesday", "2026-10-27"),
+        ("friday of next week", "2026-10-30"),
+        ("tomorrow, i.e. 2026-10-20", "2026-10-20"),
+        ("by Friday, or Monday at the latest", None),
+        ("no date here", None),
+    ],
+)
+def test_resolve_deadline(text, expected):
+    assert resolve_deadline(text, MONDAY) == expected
@@ -0,0 +1,30 @@
+"""
+Migrations are replayed when the process dies before `user_version` is bumped;
+every step has to cope with finding its work already done.
+"""
+import pytest
+
+import db
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_PATH", str(tmp_path / "migrations.db"))
+    db.close_db_connections()
+    yield db.get_db_connection()
+    db.close_db_connections()
+
+
+def test_fts_migration_replays_after_crash_before_version_bump(conn):
+    db.init_db()
+    db.save_note(1, "groceries", "buy oat milk", None)
+    latest = conn.execute("PRAGMA user_version").fetchone()[0]
+
+    # Simulate dying after migration 3 dropped fts_backfill but before user_version = 3 committed.
+    conn.execute("PRAGMA user_version = 2")
+    db.init_db()
+
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == latest
+    assert [hit["id"] for hit in db.search_notes(1, "oat")] == [1]
+    db.save_note(1, "later", "oat flakes", None)
+    assert len(db.search_notes(1, "oat")) == 2
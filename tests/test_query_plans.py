@@ -0,0 +1,88 @@
+"""
+Checks that every listing, priority and due-today query in db.py is answered
+from its index. The queries are captured as db.py runs them, then replayed under
+EXPLAIN QUERY PLAN, so a rewrite that stops using an index fails here.
+"""
+import pytest
+
+import db
+
+CURSOR = ("2026-01-01 00:00:00", 10)
+
+
+@pytest.fixture(scope="module")
+def conn(tmp_path_factory):
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("DATABASE_PATH", str(tmp_path_factory.mktemp("plans") / "plans.db"))
+        db.close_db_connections()
+        db.init_db()
+        yield db.get_db_connection()
+        db.close_db_connections()
+
+
+def _plan(conn, monkeypatch, call):
+    captured = []
+    real_fetch_all = db._fetch_all
+
+    def fetch_all(query, params):
+        captured.append((query, params))
+        return real_fetch_all(query, params)
+
+    monkeypatch.setattr(db, "_fetch_all", fetch_all)
+    call()
+    assert len(captured) == 1
+    query, params = captured[0]
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+    return " | ".join(row["detail"] for row in rows)
+
+
+LISTINGS = [
+    ("get_tasks_by_user", "idx_tasks_user_created"),
+    ("get_ideas_by_user", "idx_ideas_user_created"),
+    ("get_notes_by_user", "idx_notes_user_created"),
+    ("get_tasks_uncompleted", "idx_tasks_open_created"),
+    ("get_tasks_completed", "idx_tasks_user_status_created"),
+]
+
+
+@pytest.mark.parametrize("name, index", LISTINGS)
+@pytest.mark.parametrize(
+    "page",
+    [
+        {},
+        {"offset": 20},
+        {"cursor": CURSOR},
+        {"cursor": CURSOR, "backward": True},
+    ],
+    ids=["first", "offset", "keyset-next", "keyset-prev"],
+)
+def test_listing_uses_index(conn, monkeypatch, name, index, page):
+    plan = _plan(conn, monkeypatch, lambda: getattr(db, name)(1, limit=11, **page))
+    assert f"USING INDEX {index}" in plan or f"USING COVERING INDEX {index}" in plan, plan
+    assert "USE TEMP B-TREE" not in plan, plan
+
+
+@pytest.mark.parametrize(
+    "name, index",
+    [
+        ("get_all_tasks", "idx_tasks_user_created"),
+        ("get_all_ideas", "idx_ideas_user_created"),
+        ("get_all_notes", "idx_notes_user_created"),
+    ],
+)
+def test_full_listing_uses_index(conn, monkeypatch, name, index):
+    plan = _plan(conn, monkeypatch, lambda: getattr(db, name)(1))
+    assert f"USING INDEX {index}" in plan, plan
+    assert "USE TEMP B-TREE" not in plan, plan
+
+
+def test_priority_query_uses_index(conn, monkeypatch):
+    plan = _plan(conn, monkeypatch, lambda: db.get_tasks_by_priority(1, limit=5))
+    assert "USING INDEX idx_tasks_open_priority" in plan, plan
+    assert "USE TEMP B-TREE" not in plan, plan
+
+
+def test_due_today_query_uses_index(conn, monkeypatch):
+    plan = _plan(conn, monkeypatch, lambda: db.get_tasks_due_today_or_high_priority(1, limit=5))
+    assert "USING INDEX idx_tasks_open_priority" in plan, plan
+    assert "USE TEMP B-TREE" not in plan, plan
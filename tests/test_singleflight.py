@@ -0,0 +1,28 @@
+"""Cancellation behaviour of SingleFlight.do_async."""
+import asyncio
+
+from ai.singleflight import SingleFlight
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    async def scenario():
+        flight = SingleFlight("test")
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"value": 1}
+
+        leader = asyncio.ensure_future(flight.do_async("key", fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do_async("key", fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.gather(leader, return_exceptions=True)
+        return leader.cancelled(), await follower, calls
+
+    leader_cancelled, follower_result, calls = asyncio.run(scenario())
+    assert leader_cancelled
+    assert follower_result == {"value": 1}
+    assert calls == [1]
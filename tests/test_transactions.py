@@ -0,0 +1,63 @@
+"""
+A COMMIT that fails must leave the connection out of its transaction, so the
+next write opens a fresh one instead of nesting, unsaved, inside the dead one.
+"""
+import sqlite3
+
+import pytest
+
+import db
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    # With a rollback journal a reader's shared lock makes COMMIT fail with SQLITE_BUSY.
+    monkeypatch.setenv("DATABASE_PATH", str(tmp_path / "tx.db"))
+    monkeypatch.setenv("SQLITE_JOURNAL_MODE", "DELETE")
+    monkeypatch.setenv("SQLITE_BUSY_TIMEOUT_MS", "0")
+    db.close_db_connections()
+    db.init_db()
+    yield db.get_db_connection()
+    db.close_db_connections()
+
+
+def _count_notes(path) -> int:
+    other = sqlite3.connect(path)
+    try:
+        return other.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+    finally:
+        other.close()
+
+
+def _hold_read_lock(path) -> sqlite3.Connection:
+    reader = sqlite3.connect(path, isolation_level=None)
+    reader.execute("BEGIN")
+    reader.execute("SELECT * FROM notes").fetchall()
+    return reader
+
+
+def test_failed_commit_rolls_back(conn, tmp_path):
+    path = tmp_path / "tx.db"
+    reader = _hold_read_lock(path)
+    with pytest.raises(sqlite3.OperationalError):
+        db.save_note(1, None, "lost", None)
+    reader.execute("COMMIT")
+    reader.close()
+
+    assert not conn.in_transaction
+    db.save_note(1, None, "kept", None)
+    assert _count_notes(path) == 1
+
+
+def test_failed_group_commit_fails_batch_and_recovers(conn, tmp_path):
+    path = tmp_path / "tx.db"
+    reader = _hold_read_lock(path)
+    with pytest.raises(sqlite3.OperationalError):
+        db.group_commit([lambda: db.save_note(1, None, "a", None), lambda: db.save_note(1, None, "b", None)])
+    reader.execute("COMMIT")
+    reader.close()
+
+    assert not conn.in_transaction
+    outcomes = db.group_commit([lambda: db.save_note(1, None, "c", None)])
+    assert outcomes[0][0] is True
+    assert _count_notes(path) == 1